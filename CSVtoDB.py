@@ -1,12 +1,16 @@
 import csv
-from app import app, db
-from models import CompanyCalendar
+from database import create_app
+from models import db, CompanyCalendar
+import calendar_days
 
 CSV_PATH = 'static/company_calendar.csv'  # 実際のCSVパス
 
+app = create_app()
+
 with app.app_context():  # Flask アプリのコンテキスト内で操作
     with open(CSV_PATH, encoding='utf-8') as f:
         reader = csv.DictReader(f)
+        added = []
         for row in reader:
             # 既存に同じ日付があればスキップ
             existing = CompanyCalendar.query.filter_by(date=row['date']).first()
@@ -19,6 +23,10 @@ with app.app_context():  # Flask アプリのコンテキスト内で操作
                 type=row['type']
             )
             db.session.add(record)
+            added.append(row['date'])
 
+        # 作成済みの calendar_days（日の区分）にも反映する
+        for date_str in added:
+            calendar_days.refresh(date_str)
         db.session.commit()
     print("CSV → DB 移行完了")
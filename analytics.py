@@ -0,0 +1,248 @@
+import os
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import archive
+import worktime
+
+# 社員 × 期間（ISO週 / 月）の残業・休日出勤の集計（ヒートマップ用）。
+# 日報は社員×日に SQL でまとめてから1回で取り出し、期間への振り分けは NumPy で行う。
+
+PERIODS = ('week', 'month')
+
+# 返す指標（すべて分）。total 以外の4つは重ならずに足すと total になる
+# （残業は通常勤務の行だけ。休日出勤の残業は holiday_work に含まれる）
+METRICS = ('work', 'overtime_before', 'overtime_after', 'holiday_work', 'total')
+CATEGORIES = ('work', 'overtime_before', 'overtime_after', 'holiday_work')
+
+# 通常勤務の行の作業時間。入力が空の古い行は、合計があれば 合計 − 前残業 − 後残業（負なら使わない）、
+# 無ければ worktime と同じく開始〜終了から休憩を引いた時間（audit.py の修正と同じ順）。
+# 合計は worktime と同じく 前残業＋作業時間＋後残業 で、入力済みの合計とは作業時間を通して一致する
+_REMAINDER = '(total_minutes - COALESCE(overtime_before, 0) - COALESCE(overtime_after, 0))'
+_WORK_SQL = (
+    'COALESCE(work_minutes, CASE WHEN total_minutes IS NOT NULL AND {remainder} >= 0 '
+    'THEN {remainder} END, {derived}, 0)'
+)
+
+
+def load_columns(db_path, date_from, date_to, name=None, rules=worktime.DEFAULT_RULES):
+    """
+    期間内の日報を社員×日に集約し、列ごとの配列で返す（アーカイブ済み年度も含む）。
+
+    Returns:
+        (names, columns): columns は employee（names の添字）/ date（datetime64[D]）と METRICS の各列
+    """
+    import numpy as np
+
+    work = _WORK_SQL.format(remainder=_REMAINDER, derived=worktime.derived_work_sql(rules))
+    normal = {
+        'work': work,
+        'overtime_before': 'COALESCE(overtime_before, 0)',
+        'overtime_after': 'COALESCE(overtime_after, 0)',
+    }
+    years = archive.years_in_range(db_path, date_from, date_to)
+    conn = archive.open_reader(db_path, years)
+    try:
+        source = archive.union_source(conn, years, [
+            'name', 'date', 'overtime_before', 'overtime_after', 'work_minutes',
+            'start_hour', 'start_minute', 'end_hour', 'end_minute',
+            'is_holiday_work', 'holiday_total_minutes', 'total_minutes',
+        ])
+        where, params = 'WHERE date BETWEEN ? AND ?', [date_from, date_to]
+        if name:
+            where += ' AND name = ?'
+            params.append(name)
+        rows = conn.execute(
+            f'SELECT name, date, '
+            + ''.join(f'SUM(CASE WHEN is_holiday_work THEN 0 ELSE {sql} END), ' for sql in normal.values())
+            + f'SUM(CASE WHEN is_holiday_work THEN COALESCE(holiday_total_minutes, 0) ELSE 0 END), '
+            f'SUM(CASE WHEN is_holiday_work THEN COALESCE(holiday_total_minutes, 0) '
+            f'ELSE {" + ".join(normal.values())} END) '
+            f'FROM {source} {where} GROUP BY name, date', params).fetchall()
+    finally:
+        conn.close()
+
+    if not rows:
+        empty = np.zeros(0, dtype=np.int64)
+        return [], dict({'employee': empty, 'date': empty.astype('datetime64[D]')},
+                        **{m: empty for m in METRICS})
+
+    raw_names, raw_dates, *values = zip(*rows)
+    first_seen = {}
+    employee = np.fromiter((first_seen.setdefault(n, len(first_seen)) for n in raw_names),
+                           dtype=np.int64, count=len(raw_names))
+    # 添字を名前順に振り直す
+    names = sorted(first_seen)
+    order = np.array([first_seen[n] for n in names], dtype=np.int64)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(order.size)
+    columns = {
+        'employee': rank[employee],
+        'date': np.array(raw_dates, dtype='datetime64[D]'),
+    }
+    for metric, column in zip(METRICS, values):
+        columns[metric] = np.array(column, dtype=np.int64)
+    return names, columns
+
+
+def _period_keys(dates, period):
+    import numpy as np
+
+    if period == 'month':
+        return dates.astype('datetime64[M]').astype(np.int64)
+    days = dates.astype(np.int64)
+    # 1970-01-01 は木曜日なので (days + 3) % 7 が月曜 = 0 の曜日になる
+    thursday = (days - (days + 3) % 7 + 3).astype('datetime64[D]')
+    iso_year = thursday.astype('datetime64[Y]')
+    week = (thursday - iso_year.astype('datetime64[D]')).astype(np.int64) // 7 + 1
+    return iso_year.astype(np.int64) * 100 + week
+
+
+def _period_label(key, period):
+    if period == 'month':
+        return f'{1970 + key // 12}-{key % 12 + 1:02d}'
+    return f'{1970 + key // 100}-W{key % 100:02d}'
+
+
+def period_index(dates, period, span=None):
+    """
+    日付の配列を期間の添字と期間名に変換する。
+    week は ISO 週（'2026-W05'）、month は 'YYYY-MM'。
+    span=(開始日, 終了日) を渡すと、日報の無い期間も含めた連続した期間を並べる。
+
+    Returns:
+        (index, labels)
+    """
+    import numpy as np
+
+    keys = _period_keys(dates, period)
+    if span:
+        start, end = (np.datetime64(d, 'D') for d in span)
+        axis = np.unique(_period_keys(np.arange(start, end + 1), period))
+    else:
+        axis = np.unique(keys)
+    return np.searchsorted(axis, keys), [_period_label(int(k), period) for k in axis]
+
+
+def check_totals(result):
+    """
+    区分（CATEGORIES）の合計が total と一致し、どの指標も負でないか確かめる。
+    そうでなければ ValueError
+    """
+    import numpy as np
+
+    total = np.asarray(result['total'], dtype=np.int64)
+    parts = sum(np.asarray(result[c], dtype=np.int64) for c in CATEGORIES)
+    if total.shape != parts.shape or not np.array_equal(total, parts):
+        raise ValueError('区分の合計が total と一致しません')
+    negative = [m for m in METRICS if (np.asarray(result[m], dtype=np.int64) < 0).any()]
+    if negative:
+        raise ValueError(f'負の値があります: {", ".join(negative)}（audit.py で日報を確認してください）')
+
+
+def aggregate(names, columns, period='week', span=None):
+    """
+    社員 × 期間で集計する。span は period_index() を参照。
+
+    Returns:
+        dict: names, periods と、指標ごとの [社員][期間] の2次元配列（分）
+    """
+    import numpy as np
+
+    if period not in PERIODS:
+        raise ValueError(f'period は {" / ".join(PERIODS)} のどれかです: {period}')
+
+    index, periods = period_index(columns['date'], period, span)
+    n_employees, n_periods = len(names), len(periods)
+    cell = columns['employee'] * n_periods + index
+    result = {'period': period, 'names': names, 'periods': periods}
+    for metric in METRICS:
+        totals = np.bincount(cell, weights=columns[metric], minlength=n_employees * n_periods)
+        result[metric] = totals.astype(np.int64).reshape(n_employees, n_periods).tolist()
+    check_totals(result)
+    return result
+
+
+def overtime_heatmap(db_path, date_from, date_to, period='week', name=None,
+                     rules=worktime.DEFAULT_RULES):
+    names, columns = load_columns(db_path, date_from, date_to, name, rules)
+    result = aggregate(names, columns, period, (date_from, date_to))
+    result.update({'from': date_from, 'to': date_to})
+    return result
+
+
+# ---- 計測 ----
+
+def make_synthetic_db(path, n_employees=200, year=2025, reports_per_day=3, seed=0):
+    """計測用に1年分の日報を持つ DB を作る"""
+    from datetime import date as dt_date, timedelta
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute(
+        'CREATE TABLE daily_reports (id INTEGER PRIMARY KEY, name VARCHAR(100), date VARCHAR(10), '
+        'overtime_before INTEGER, overtime_after INTEGER, work_minutes INTEGER, '
+        'start_hour INTEGER, start_minute INTEGER, end_hour INTEGER, end_minute INTEGER, '
+        'is_holiday_work BOOLEAN, holiday_total_minutes INTEGER, total_minutes INTEGER)')
+    conn.execute('CREATE INDEX ix_daily_reports_date ON daily_reports (date)')
+    day = dt_date(year, 1, 1)
+    while day.year == year:
+        holiday = day.weekday() >= 5
+        rows = []
+        for employee in range(n_employees):
+            if holiday and rng.random() > 0.1:
+                continue
+            for _ in range(reports_per_day):
+                minutes = rng.choice((60, 90, 120, 150))
+                before = 0 if holiday else rng.choice((0, 0, 30))
+                after = 0 if holiday else rng.choice((0, 0, 30, 60))
+                rows.append((
+                    f'社員{employee:03d}', day.isoformat(), before, after,
+                    None if holiday else minutes,
+                    holiday, minutes if holiday else None,
+                    None if holiday else before + minutes + after,
+                ))
+        conn.executemany(
+            'INSERT INTO daily_reports (name, date, overtime_before, overtime_after, work_minutes, '
+            'is_holiday_work, holiday_total_minutes, total_minutes) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        day += timedelta(days=1)
+    conn.commit()
+    conn.close()
+
+
+def benchmark(n_employees=200, year=2025, repeat=3):
+    """1年分・n_employees 人の集計にかかる時間を測る"""
+    work = tempfile.mkdtemp(prefix='analytics-bench-')
+    path = os.path.join(work, 'unified.db')
+    try:
+        make_synthetic_db(path, n_employees, year)
+        rows = sqlite3.connect(path).execute('SELECT COUNT(*) FROM daily_reports').fetchone()[0]
+        result = {'rows': rows}
+        for period in PERIODS:
+            times = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                overtime_heatmap(path, f'{year}-01-01', f'{year}-12-31', period)
+                times.append(time.perf_counter() - started)
+            result[f'{period}_seconds'] = min(times)
+        return result
+    finally:
+        for filename in os.listdir(work):
+            os.remove(os.path.join(work, filename))
+        os.rmdir(work)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='残業・休日出勤の集計のベンチマーク')
+    parser.add_argument('--employees', type=int, default=200)
+    args = parser.parse_args()
+
+    result = benchmark(args.employees)
+    print(f"{result['rows']:,}行  週別 {result['week_seconds'] * 1000:.0f} ms  "
+          f"月別 {result['month_seconds'] * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
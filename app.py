@@ -1,48 +1,77 @@
 import os
-import jpholiday
-from flask import Flask, render_template, request, redirect, url_for, jsonify, session
-from models import db, DailyReport, CompanyCalendar
-from datetime import datetime, timedelta
+from flask import Flask, render_template, request, redirect, url_for, jsonify, session, send_file, abort
+from models import db, DailyReport, CompanyCalendar, Job, SubmitReceipt, Project
 from collections import defaultdict
-from operator import attrgetter
 from sqlalchemy import func
-from datetime import datetime, date as dt_date
-from holiday_manager import HolidayManager
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
-
-# 安定するpath
-# このファイルがあるディレクトリ（app.py）
-BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-
-# 親ディレクトリの絶対パス
-PARENT_DIR = os.path.abspath(os.path.join(BASE_DIR, '..'))
-
-# 上の階層の db ディレクトリを使う
-DB_DIR = os.path.join(PARENT_DIR, 'db')
-
-# ディレクトリがなければ作る
-if not os.path.exists(DB_DIR):
-    os.makedirs(DB_DIR)
-
-# 共通DBファイルのパス
-DB_PATH = os.path.join(DB_DIR, 'unified.db')
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from datetime import datetime, timedelta, date as dt_date
+import database
+import report_render
+import analytics
+import archive
+import backup
+import calendar_days
+import changelog
+import jobs
+import monthly
+import projects
+import replica
+import singleflight
+import timeline
+import worktime
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_PATH}'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] =False
-app.secret_key ='super_secret_key'
-app.permanent_session_lifetime = timedelta(minutes=5) # セッションの有効期限を10分に設定
-db.init_app(app)
-
-migrate = Migrate(app, db)
-
-@app.template_filter('comma')
-def comma_filter(value):
-    try:
-        return "{:,}".format(int(value))
-    except (ValueError, TypeError):
-        return value
+# 設定は環境変数 FLASK_<名前> でも変えられる（例: FLASK_REPLICA_ENABLED=true）
+app.config.from_prefixed_env()
+database.init_app(app)
+
+# バックグラウンドジョブ（最初のリクエストで起動）
+job_runner = jobs.JobRunner(app)
+# 定期バックアップ（BACKUP_INTERVAL_HOURS に間隔を入れると有効。例: FLASK_BACKUP_INTERVAL_HOURS=24）。
+# 既定では無効なので、テストや計測で起動したプロセスが本番のバックアップを積むことはない
+if app.config.get('BACKUP_INTERVAL_HOURS', 0):
+    job_runner.every(timedelta(hours=app.config['BACKUP_INTERVAL_HOURS']), 'backup_database',
+                     keep=app.config.get('BACKUP_KEEP', backup.DEFAULT_KEEP))
+
+@app.before_request
+def start_job_runner():
+    # JOBS_ENABLED=False なら起動しない（計測やテストで本番のジョブを動かさないため）
+    if app.config.get('JOBS_ENABLED', True):
+        job_runner.start()
+
+# 読み取りの多い画面はスナップショットから返す（REPLICA_ENABLED=True で有効）。
+# スナップショットの作り直しはジョブで行うので、複数プロセスで動かしても1か所で済む
+read_replica = replica.Replica.from_config(app, database.db_path(app))
+if app.config.get('REPLICA_ENABLED', False):
+    read_replica.init_app()
+    job_runner.every(timedelta(seconds=read_replica.refresh_seconds), 'refresh_replica')
+
+# 同じ内容の同時リクエストは1回の計算にまとめる（SINGLE_FLIGHT_ENABLED=False で無効）。
+# データのバージョンは change_log の最新の seq
+single_flight = singleflight.SingleFlight.from_config(app, version=changelog.latest_seq)
+
+app.add_template_filter(report_render.comma_filter, 'comma')
+
+def work_rules():
+    """就業ルール（app.config['WORK_RULES'] で上書きできる）"""
+    return worktime.WorkRules.from_config(app.config)
+
+def fetch_reports(name=None, date=None, month=None):
+    """日報を検索する（アーカイブ済み年度も含む）"""
+    return archive.query_reports(database.db_path(), name=name, date=date, month=month)
+
+
+def sum_monthly_minutes(name, month, column='total_minutes'):
+    """1人1か月分の列の合計（アーカイブ済み年度も含む）"""
+    years = archive.years_in_range(database.db_path(), f'{month}-01', f'{month}-31')
+    if years:
+        return archive.sum_minutes(database.db_path(), years, column, name=name, month=month)
+
+    return db.session.query(func.sum(getattr(DailyReport, column)))\
+        .filter(DailyReport.name == name)\
+        .filter(DailyReport.date.like(f'{month}-%'))\
+        .scalar() or 0
 
 # 土曜出勤、祝日、会社休日の情報を取得
 @app.route('/calendar')
@@ -50,6 +79,7 @@ def calendar():
     return render_template('calendar.html')
 
 @app.route('/api/calendar')
+@single_flight.coalesce
 def api_calendar():
     events = []
 
@@ -115,6 +145,7 @@ def api_calendar():
             
 
     # jpholidayの祝日
+    import jpholiday
     for year in years:
 
         for date_obj, name in jpholiday.year_holidays(year):
@@ -146,6 +177,7 @@ def api_delete():
 
     # 削除
     db.session.delete(record)
+    calendar_days.refresh(date)
     db.session.commit()
 
     return jsonify({'status': 'deleted'})
@@ -167,6 +199,7 @@ def api_update():
         record = CompanyCalendar(date=date, description=description, type=day_type)
         db.session.add(record)
 
+    calendar_days.refresh(date)
     db.session.commit()
     return jsonify({'status': 'success'})
     
@@ -193,40 +226,12 @@ def api_check_holiday():
         return jsonify({'error': 'date is required'}), 400
 
     try:
-        date_obj = datetime.strptime(date_str, '%Y-%m-%d')
+        info = calendar_days.day_info(date_str)
     except ValueError:
         return jsonify({'error': 'invalid date format'}), 400
-    
-    # フロントから来た日付の MM-DD を抽出
-    mmdd = date_obj.strftime('%m-%d')
 
-    # DBで会社カレンダーを確認
-    record = CompanyCalendar.query.filter(
-        (CompanyCalendar.date==date_str) | (CompanyCalendar.date==mmdd)
-    ).first()
-
-    is_forced_paidleave = record and record.type.strip().lower() == 'paidleave'
-
-    if record:
-        rtype = record.type.strip().lower()
-        if rtype == 'holiday':
-            is_holiday = True
-        elif rtype == 'workday':
-            is_holiday = False
-        elif rtype == 'paidleave':
-            # 業務ロジック: 有給は休日扱いしない（必要ならTrueに変更）
-            is_holiday = False
-            is_forced_paidleave = True
-        else:
-            is_holiday = False
-    else:
-        # DB になければ土日・祝日で判定
-        if date_obj.weekday() >= 5:  # 土日
-            is_holiday = True
-        elif jpholiday.is_holiday(date_obj):
-            is_holiday = True
-        else:
-            is_holiday = False
+    is_holiday = info.is_holiday
+    is_forced_paidleave = info.is_forced_paidleave
 
     return jsonify({'date': date_str, 'is_holiday': is_holiday, 'is_forced_paidleave': is_forced_paidleave})
 
@@ -239,30 +244,11 @@ def index():
 
     # 今日の日付（初期値）
     today = datetime.now().strftime('%Y-%m-%d')
-    today_obj = datetime.strptime(today, '%Y-%m-%d')
 
-    # DB で会社カレンダーを検索
-    record = CompanyCalendar.query.filter_by(date=today).first()
-    is_forced_paidleave = record and record.type == 'paidleave'
-    if record:
-        if record.type == 'holiday':
-            is_holiday = True
-        elif record.type == 'workday':
-            is_holiday = False
-        elif record.type == 'paidleave':
-            is_holiday = False  # 有給を休日扱いにする場合
-            is_forced_paidleave = True
-        else:
-            is_holiday = False
-    else:
-        # DB にない場合は土日か祝日判定
-        if today_obj.weekday() >= 5:  # 土日
-            is_holiday = True
-        elif jpholiday.is_holiday(today_obj):
-            is_holiday = True
-        else:
-            is_holiday = False
-       
+    # 休日・指定有給日の判定
+    info = calendar_days.day_info(today)
+    is_holiday = info.is_holiday
+    is_forced_paidleave = info.is_forced_paidleave
 
     return render_template('index.html',
                            name_list=name_list,
@@ -270,17 +256,25 @@ def index():
                            is_holiday=is_holiday,
                            is_forced_paidleave=is_forced_paidleave)
 
-@app.route('/submit', methods=['POST'])
-def submit():
-    data = request.json
-    reports = data.get('reports', [])
-    name = data.get('name', '未入力')
-    date = data.get('date', datetime.now().strftime('%Y-%m-%d'))
-    is_holiday_work = data.get('is_holiday_work', False)
-
-    # この日が「指定有給日」かどうかを判定   
-    calendar_entry = CompanyCalendar.query.filter_by(date=date).first()
-    forced_paidleave = calendar_entry and calendar_entry.type == 'paidleave'
+def overwrite_report(report, data):
+    """新しく登録したときと同じ内容で既存の行を上書きする（id・version 以外は初期値に戻す）"""
+    for column in DailyReport.__table__.columns:
+        if column.key in ('id', 'version'):
+            continue
+        default = column.default.arg if column.default is not None and not callable(column.default.arg) else None
+        setattr(report, column.key, data.get(column.key, default))
+
+# 一括登録で1回に受け付ける日数と、冪等キーを覚えておく期間
+SUBMIT_BATCH_LIMIT = 100
+SUBMIT_RECEIPT_RETENTION = timedelta(days=30)
+
+def save_day(name, date, is_holiday_work, reports):
+    """1人1日分の日報を保存する（同じ件名の既存行は上書き。コミットは呼び出し側）"""
+    # この日が「指定有給日」かどうかを判定
+    try:
+        forced_paidleave = calendar_days.day_info(date).is_forced_paidleave
+    except ValueError:
+        forced_paidleave = False
 
     for entry in reports:
         work_minutes = entry.get('work_minutes') or 0
@@ -292,10 +286,8 @@ def submit():
         if entry_total != calc_total:
             entry_total = calc_total
 
-        # 既存レポートがある場合は削除して上書き
+        # 既存レポートがある場合は同じ行を上書き（id を変えない）
         existing = DailyReport.query.filter_by(name=name, date=date, title=entry.get('title')).first()
-        if existing:
-            db.session.delete(existing)
 
         # 共通部分
         base_data = dict(
@@ -329,7 +321,7 @@ def submit():
             # 指定有給日の場合は差分を自動計算
             if forced_paidleave:
                 worked = work_minutes + overtime_before + overtime_after
-                paid_leave = max(0, 480 - worked)
+                paid_leave = max(0, work_rules().standard_day_minutes - worked)
             else:
                 paid_leave = entry.get('paid_leave_minutes', 0)
 
@@ -343,26 +335,132 @@ def submit():
                 paid_leave_minutes=paid_leave
         )
         
-        report = DailyReport(**base_data)   
-        db.session.add(report)
+        if existing:
+            overwrite_report(existing, base_data)
+        else:
+            db.session.add(DailyReport(**base_data))
+
+
+@app.route('/submit', methods=['POST'])
+def submit():
+    data = request.json
+    reports = data.get('reports', [])
+    name = data.get('name', '未入力')
+    date = data.get('date', datetime.now().strftime('%Y-%m-%d'))
+    is_holiday_work = data.get('is_holiday_work', False)
 
+    save_day(name, date, is_holiday_work, reports)
     db.session.commit()
     return {'status': 'success'}
 
+# 日報1件のうち、文字で受け取る項目と時刻（時・分）の項目
+SUBMIT_TEXT_FIELDS = ('title', 'task', 'partner')
+SUBMIT_TIME_FIELDS = ('start_hour', 'start_minute', 'end_hour', 'end_minute')
+
+def parse_submit_batch(batch):
+    """
+    一括登録の1件（1人1日分）を確かめる。時間は一括編集と同じ決まり（parse_grid_fields）で
+    分の整数にそろえるので、save_day は数値だけを受け取る。
+
+    Returns:
+        (名前, 日付, 日報のリスト)。不正な値があれば ValueError（メッセージ付き）
+    """
+    date = batch.get('date')
+    try:
+        datetime.strptime(date or '', '%Y-%m-%d')
+    except (TypeError, ValueError):
+        raise ValueError(f'日付が不正です: {date}')
+    name = batch.get('name')
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError('名前がありません')
+
+    reports = batch.get('reports') or []
+    if not isinstance(reports, list) or not all(isinstance(entry, dict) for entry in reports):
+        raise ValueError('reports は日報のリストで送ってください')
+    cleaned = []
+    for entry in reports:
+        for key in SUBMIT_TEXT_FIELDS:
+            if entry.get(key) is not None and not isinstance(entry[key], str):
+                raise ValueError(f'{key} は文字で入力してください')
+        for key in SUBMIT_TIME_FIELDS:
+            value = entry.get(key)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, int)):
+                raise ValueError(f'{key} は整数で入力してください')
+        _, minutes = parse_grid_fields({k: entry[k] for k in GRID_MINUTE_FIELDS if k in entry})
+        cleaned.append(dict(entry, **minutes))
+    return name.strip(), date, cleaned
+
+# 複数日分の一括登録API（端末に溜めた送信待ちをまとめて送る）
+@app.route('/api/submit_batch', methods=['POST'])
+def submit_batch():
+    """
+    複数の (名前, 日付, 日報) をまとめて1トランザクションで保存するAPI。
+
+    Args:
+        JSON:
+            {
+                "batches": [
+                    {"key": 冪等キー, "name", "date", "is_holiday_work", "reports": [...]},
+                    ...
+                ]
+            }
+
+    Returns:
+        JSONオブジェクト:
+            {"results": [{"key", "status": "saved" / "duplicate" / "invalid", "message"}, ...]}
+            保存済みのキーをもう一度送っても "duplicate" になるだけで行は増えない。
+    """
+    batches = (request.get_json(silent=True) or {}).get('batches') or []
+    if not isinstance(batches, list):
+        return jsonify({'error': 'batches はリストで送ってください'}), 400
+    if len(batches) > SUBMIT_BATCH_LIMIT:
+        return jsonify({'error': f'1回に送れるのは{SUBMIT_BATCH_LIMIT}件までです'}), 400
+
+    keys = [b['key'] for b in batches if isinstance(b, dict) and isinstance(b.get('key'), str)]
+    seen = {r.key for r in SubmitReceipt.query.filter(SubmitReceipt.key.in_(keys))}
+
+    # 1件ずつ確かめ、不正なものはそのキーだけ invalid にする（ほかの件は保存する）
+    results = []
+    for batch in batches:
+        key = batch.get('key') if isinstance(batch, dict) else None
+        if not key or not isinstance(key, str):
+            results.append({'key': key, 'status': 'invalid', 'message': 'key がありません'})
+            continue
+        if len(key) > 64:
+            results.append({'key': key, 'status': 'invalid', 'message': 'key が長すぎます（64文字まで）'})
+            continue
+        if key in seen:
+            results.append({'key': key, 'status': 'duplicate'})
+            continue
+        try:
+            name, date, reports = parse_submit_batch(batch)
+        except ValueError as e:
+            results.append({'key': key, 'status': 'invalid', 'message': str(e)})
+            continue
+
+        save_day(name, date, bool(batch.get('is_holiday_work')), reports)
+        db.session.add(SubmitReceipt(key=key, name=name, date=date, report_count=len(reports)))
+        seen.add(key)
+        results.append({'key': key, 'status': 'saved'})
+
+    # 古い受付記録は消しておく（端末の再送はこれより短い間に終わる前提）
+    SubmitReceipt.query.filter(SubmitReceipt.created_at < datetime.now() - SUBMIT_RECEIPT_RETENTION)\
+        .delete(synchronize_session=False)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # 同じキーが同時に送られた。再送すれば duplicate になる
+        db.session.rollback()
+        return jsonify({'error': 'retry'}), 409
+    return jsonify({'results': results})
+
 # 確認用一覧画面
 @app.route('/view_reports')
 def view_reports():
     name = request.args.get('name')
     date = request.args.get('date')
 
-    query = DailyReport.query
-
-    if name:
-        query = query.filter(DailyReport.name.contains(name))
-    if date:
-        query = query.filter(DailyReport.date == date)
-
-    reports = query.order_by(DailyReport.date.desc(), DailyReport.name).all()
+    reports = fetch_reports(name=name, date=date)
 
     # Noneの値を0に変換
     for r in reports:
@@ -374,12 +472,27 @@ def view_reports():
             r.paid_leave_minutes = 0
     return render_template('view_reports.html', reports=reports)
     
+def recompute_totals(report):
+    """前残業・作業時間・後残業から合計を計算し直す（休日出勤は休日側の列）"""
+    before = report.overtime_before or 0
+    after = report.overtime_after or 0
+    if report.is_holiday_work:
+        report.holiday_total_minutes = before + (report.holiday_work_minutes or 0) + after
+    else:
+        report.total_minutes = before + (report.work_minutes or 0) + after
+
 # 編集ルート
 @app.route('/edit/<int:id>', methods=['GET', 'POST'])
 def edit_report(id):
     report = DailyReport.query.get_or_404(id)
 
     if request.method == 'POST':
+        # 編集画面を開いた後に他の人が更新していたら上書きしない
+        version = request.form.get('version', type=int)
+        if version is not None and version != report.version:
+            return render_template('edit_report.html', report=report,
+                                   error='他の人が先に更新しました。内容を確認してください。'), 409
+
         report.date = request.form['date']
         report.name = request.form['name']
         report.title = request.form['title']
@@ -392,17 +505,139 @@ def edit_report(id):
         if report.is_holiday_work:
             # 休日出勤の場合
             report.holiday_work_minutes = int(float(request.form['work_minutes']) * 60)
-            report.holiday_total_minutes = report.overtime_before + report.holiday_work_minutes + report.overtime_after
         else:
             # 通常勤務の場合
             report.work_minutes = int(float(request.form['work_minutes']) * 60)
-            report.total_minutes = report.overtime_before + report.work_minutes + report.overtime_after
+        recompute_totals(report)
 
         db.session.commit()
         return redirect(request.referrer or url_for('view_reports'))
     
     return render_template('edit_report.html', report=report)
 
+# 一覧から一括編集できる項目
+GRID_TEXT_FIELDS = ('date', 'name', 'title', 'task', 'partner')
+GRID_MINUTE_FIELDS = ('overtime_before', 'work_minutes', 'overtime_after', 'paid_leave_minutes')
+# 1つの項目に入れられる分の上限（1日分）
+GRID_MAX_MINUTES = 24 * 60
+
+def parse_grid_fields(fields):
+    """
+    一括編集で送られた項目を確かめる（登録と同じく日付は YYYY-MM-DD、名前は必須）。
+    時間は 0〜GRID_MAX_MINUTES の整数の分で、空なら 0。
+
+    Returns:
+        (文字の項目, 時間の項目) の dict。不正な値があれば ValueError（メッセージ付き）
+    """
+    text = {k: fields[k] for k in GRID_TEXT_FIELDS if k in fields}
+    if 'date' in text:
+        try:
+            datetime.strptime(text['date'] or '', '%Y-%m-%d')
+        except (TypeError, ValueError):
+            raise ValueError(f"日付が不正です: {text['date']}")
+    if 'name' in text:
+        text['name'] = (text['name'] or '').strip()
+        if not text['name']:
+            raise ValueError('名前がありません')
+
+    minutes = {}
+    for key in GRID_MINUTE_FIELDS:
+        if key not in fields:
+            continue
+        value = fields[key]
+        if value is None or value == '':
+            value = 0
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError(f'{key} は分の整数で入力してください')
+        try:
+            number = float(value)
+        except ValueError:
+            raise ValueError(f'{key} は分の整数で入力してください')
+        if not number.is_integer():
+            raise ValueError(f'{key} は分の整数で入力してください')
+        if not 0 <= number <= GRID_MAX_MINUTES:
+            raise ValueError(f'{key} は0〜{GRID_MAX_MINUTES}分で入力してください')
+        minutes[key] = int(number)
+    return text, minutes
+
+def report_to_grid(report):
+    return {
+        'id': report.id,
+        'version': report.version,
+        'date': report.date,
+        'name': report.name,
+        'title': report.title,
+        'task': report.task,
+        'partner': report.partner,
+        'overtime_before': report.overtime_before or 0,
+        'work_minutes': (report.holiday_work_minutes if report.is_holiday_work else report.work_minutes) or 0,
+        'overtime_after': report.overtime_after or 0,
+        'paid_leave_minutes': report.paid_leave_minutes or 0,
+        'total_minutes': (report.holiday_total_minutes if report.is_holiday_work else report.total_minutes) or 0,
+    }
+
+# 一括編集API（変更したセルだけを送る）
+@app.route('/api/reports', methods=['PATCH'])
+def api_patch_reports():
+    """
+    一覧画面で変更したセルをまとめて保存するAPI。
+
+    Args:
+        JSON: {"changes": [{"id": 1, "version": 3, "fields": {"overtime_after": 30, ...}}, ...]}
+              時間の項目は分で送る。
+
+    Returns:
+        JSONオブジェクト:
+            {
+                "updated": 保存した行（新しい version と合計を含む）,
+                "conflicts": 保存しなかった行と理由（version 不一致なら現在の値も返す。
+                             値が不正なら reason は invalid で message に理由）
+            }
+        同じ id が2回以上あるときは 400 で何も保存しない。
+    """
+    data = request.get_json() or {}
+    changes = data.get('changes', [])
+
+    ids = [c.get('id') for c in changes]
+    duplicated = sorted({i for i in ids if ids.count(i) > 1}, key=str)
+    if duplicated:
+        return jsonify({'error': f'id が重複しています: {duplicated}'}), 400
+    reports = {r.id: r for r in DailyReport.query.filter(DailyReport.id.in_(ids)).all()}
+
+    updated, conflicts = [], []
+    for change in changes:
+        report = reports.get(change.get('id'))
+        if report is None:
+            conflicts.append({'id': change.get('id'), 'reason': 'not_found'})
+            continue
+        if change.get('version') != report.version:
+            conflicts.append({'id': report.id, 'reason': 'version', 'current': report_to_grid(report)})
+            continue
+
+        try:
+            text, minutes = parse_grid_fields(change.get('fields') or {})
+        except ValueError as e:
+            conflicts.append({'id': report.id, 'reason': 'invalid', 'message': str(e)})
+            continue
+
+        for key, value in text.items():
+            setattr(report, key, value)
+        for key, value in minutes.items():
+            if key == 'work_minutes' and report.is_holiday_work:
+                key = 'holiday_work_minutes'
+            setattr(report, key, value)
+        recompute_totals(report)
+        updated.append(report)
+
+    # まとめて1回でコミット（version は flush 時に +1 される）
+    try:
+        db.session.commit()
+    except StaleDataError:
+        # 読み込みからコミットまでの間に他の人が更新した
+        db.session.rollback()
+        return jsonify({'updated': [], 'conflicts': [], 'error': 'retry'}), 409
+    return jsonify({'updated': [report_to_grid(r) for r in updated], 'conflicts': conflicts})
+
 # 削除ルート
 @app.route('/delete/<int:id>')
 def delete_report(id):
@@ -413,26 +648,23 @@ def delete_report(id):
 
 # 一人１日をカード表示
 @app.route('/chart')
+@single_flight.coalesce
 def report_chart():
     name = request.args.get('name', '')
     date = request.args.get('date', '')
     today = dt_date.today().isoformat()
     total_minutes = 0  # 初期値を定義
 
-    query =DailyReport.query
-
-    if name:
-        query = query.filter(DailyReport.name.contains(name))
-    if date:
-        query = query.filter(DailyReport.date == date)
-
-    reports = query.order_by(DailyReport.date.desc(), DailyReport.name).all()
+    reports = fetch_reports(name=name, date=date)
 
     # 日別合計
     daily_totals = defaultdict(int)
     monthly_total = 0
     holiday_info = {}
 
+    # 表示する日付の区分をまとめて取得
+    days = calendar_days.day_types_for(r.date for r in reports)
+
     for report in reports:
         # 勤務時間の取得
         if report.is_holiday_work:
@@ -445,33 +677,24 @@ def report_chart():
         monthly_total += work_time
 
         # 休日判定
-        date_obj = datetime.strptime(report.date, '%Y-%m-%d')
-        # DBの会社カレンダーを確認
-        record = CompanyCalendar.query.filter_by(date=report.date).first()
+        day = days.get(report.date)
 
         if report.is_holiday_work:
             # 休日出勤
             holiday_info[key] = 'holiday' # 休日出勤
-        elif record and record.type == 'paidleave':
+        elif day is not None and day.is_forced_paidleave:
             # 指定有給日
             holiday_info[key] = 'paidleave' # 指定有給日
-        elif record and record.type == 'holiday':
-            # 会社休日
-            holiday_info[key] = 'holiday' # 会社休日
+        elif day is not None and day.is_holiday:
+            # 会社休日・土日祝
+            holiday_info[key] = 'holiday'
         else:
-            # DBにない場合は土日・祝日で判定
-            if date_obj.weekday() >= 5 or jpholiday.is_holiday(date_obj):
-                holiday_info[key] = 'holiday' # 土日祝
-            else:
-                holiday_info[key] = None # 平日
-    
+            holiday_info[key] = None # 平日
+
     # 月の合計を求める
     if name and date:
         month_str = date[:7]
-        total_minutes = db.session.query(func.sum(DailyReport.total_minutes))\
-            .filter(DailyReport.name == name)\
-            .filter(DailyReport.date.like(f'{month_str}-%'))\
-            .scalar() or 0
+        total_minutes = sum_monthly_minutes(name, month_str)
         
     # 社員名一覧
     all_names = db.session.query(DailyReport.name).distinct().order_by(DailyReport.name).all()
@@ -492,6 +715,54 @@ def report_chart():
                            total_minutes=total_minutes
                            )
 
+# 日報タイムライン（ガントチャート）画面
+@app.route('/timeline')
+def timeline_page():
+    today = dt_date.today()
+    name_list = [n[0] for n in db.session.query(DailyReport.name).distinct().order_by(DailyReport.name)]
+    return render_template('timeline.html',
+                           name=request.args.get('name', ''),
+                           name_list=name_list,
+                           date_from=request.args.get('from') or today.replace(day=1).isoformat(),
+                           date_to=request.args.get('to') or today.isoformat())
+
+# 日報タイムラインAPI（列ごとの配列）
+@app.route('/api/timeline')
+def api_timeline():
+    """
+    期間内の日報の時間帯を列ごとの配列で返すAPI。社員名と件名は辞書の添字で返す。
+
+    Args:
+        from (str): 開始日 'YYYY-MM-DD'。省略時は今月1日。
+        to (str): 終了日 'YYYY-MM-DD'。省略時は今日。最大 timeline.MAX_DAYS 日。
+        name (str): 社員名で絞り込む。
+
+    Returns:
+        JSONオブジェクト:
+            {
+                "names", "titles": 辞書, "day_types": 日ごとの区分,
+                "name", "title", "day", "type", "start", "end", "before", "after", "minutes":
+                    日報ごとの値（時刻は0時からの分）
+            }
+    """
+    today = dt_date.today()
+    try:
+        result = timeline.timeline(database.db_path(),
+                                   request.args.get('from') or today.replace(day=1).isoformat(),
+                                   request.args.get('to') or today.isoformat(),
+                                   request.args.get('name') or None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # 数字の並びはよく縮むので、受け取れるブラウザには gzip で返す
+    gzipped = 'gzip' in request.accept_encodings
+    response = app.response_class(timeline.encode(result, 6 if gzipped else None),
+                                  mimetype='application/json')
+    if gzipped:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
 # 役職ログインAPI
 @app.route('/login_role', methods=['POST'])
 def login_role():
@@ -512,6 +783,84 @@ def login_role():
     else:
         return jsonify({'success': False})
     
+# 休日出勤の集計API（calendar_days と結合）
+@app.route('/api/holiday_work')
+def api_holiday_work():
+    """
+    年間の休日出勤時間を社員 × 日の区分で返すAPI。
+
+    Args:
+        year (int): 対象年。省略時は今年。
+        day_type (str): 区分で絞り込む（例: national_holiday）。複数指定可。
+    """
+    year = request.args.get('year', datetime.now().year, type=int)
+    day_types = request.args.getlist('day_type') or calendar_days.HOLIDAY_TYPES
+    return jsonify(calendar_days.holiday_work_summary(year, day_types))
+
+# 残業・休日出勤のヒートマップ画面
+@app.route('/analytics')
+def analytics_page():
+    year = datetime.now().year
+    return render_template('analytics.html', date_from=f'{year}-01-01', date_to=f'{year}-12-31')
+
+# 残業・休日出勤の集計API（社員 × ISO週 / 月）
+@app.route('/api/analytics/overtime')
+def api_overtime_analytics():
+    """
+    社員 × 期間の残業・休日出勤時間を返すAPI。
+
+    Args:
+        from (str): 開始日 'YYYY-MM-DD'。省略時は今年の1月1日。
+        to (str): 終了日 'YYYY-MM-DD'。省略時は今年の12月31日。
+        period (str): week（ISO週）または month。
+        name (str): 社員名で絞り込む。
+
+    Returns:
+        JSONオブジェクト:
+            {
+                "names": 社員名の配列, "periods": 期間名の配列,
+                "work", "overtime_before", "overtime_after", "holiday_work", "total":
+                    [社員][期間] の2次元配列（分）。残業は通常勤務の行だけで、
+                    work + overtime_before + overtime_after + holiday_work = total
+            }
+    """
+    year = datetime.now().year
+    date_from = request.args.get('from') or f'{year}-01-01'
+    date_to = request.args.get('to') or f'{year}-12-31'
+    try:
+        datetime.strptime(date_from, '%Y-%m-%d')
+        datetime.strptime(date_to, '%Y-%m-%d')
+        result = analytics.overtime_heatmap(database.db_path(), date_from, date_to,
+                                            request.args.get('period', 'week'),
+                                            request.args.get('name') or None,
+                                            rules=work_rules())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result)
+
+# 変更履歴の差分取得API
+@app.route('/api/changes')
+def api_changes():
+    """
+    since より後の変更をまとめて返すAPI。
+
+    Args:
+        since (int): 前回受け取った next。初回は 0。
+        limit (int): 1回に返す最大件数。
+        table (str): テーブルで絞り込む（daily_reports / company_calendar）。複数指定可。
+
+    Returns:
+        JSONオブジェクト:
+            {
+                "seq", "table", "key", "op", "data": 変更ごとの値を並べた配列,
+                "next": 次回の since,
+                "more": まだ続きがあれば True
+            }
+    """
+    since = request.args.get('since', 0, type=int)
+    limit = request.args.get('limit', changelog.DEFAULT_BATCH_SIZE, type=int)
+    return jsonify(changelog.changes_since(since, limit, request.args.getlist('table')))
+
 # ログイン状態確認ＡＰＩ
 @app.route('/check_login', methods=['POST'])
 def check_login():
@@ -544,54 +893,178 @@ def check_approval():
     else:
         return jsonify({'success': False, 'message': 'レポートが見つかりません'})
     
+def is_role_logged_in():
+    return any(session.get(f'{role}_logged_in') for role in ('manager', 'director', 'president'))
+
+# ジョブ登録API
+@app.route('/api/jobs', methods=['POST'])
+def api_enqueue_job():
+    if not is_role_logged_in():
+        return jsonify({'success': False, 'message': 'ログインしてください'}), 403
+
+    data = request.get_json() or {}
+    try:
+        record = jobs.enqueue(data.get('kind'), **(data.get('params') or {}))
+    except (ValueError, TypeError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify(jobs.job_to_dict(record)), 202
+
+# ジョブ一覧API
+@app.route('/api/jobs')
+def api_jobs():
+    query = Job.query
+    status = request.args.get('status')
+    if status:
+        query = query.filter(Job.status == status)
+    records = query.order_by(Job.id.desc()).limit(request.args.get('limit', 50, type=int)).all()
+    return jsonify([jobs.job_to_dict(r) for r in records])
+
+# ジョブ状態・進捗API
+@app.route('/api/jobs/<int:job_id>')
+def api_job_status(job_id):
+    record = db.session.get(Job, job_id)
+    if not record:
+        return jsonify({'error': 'not found'}), 404
+    return jsonify(jobs.job_to_dict(record))
+
+# ジョブキャンセルAPI
+@app.route('/api/jobs/<int:job_id>/cancel', methods=['POST'])
+def api_cancel_job(job_id):
+    if not is_role_logged_in():
+        return jsonify({'success': False, 'message': 'ログインしてください'}), 403
+
+    record = jobs.cancel(job_id)
+    if not record:
+        return jsonify({'error': 'not found'}), 404
+    return jsonify(jobs.job_to_dict(record))
+
+# バックアップ一覧API（管理用）
+@app.route('/api/admin/backups')
+def api_backups():
+    if not is_role_logged_in():
+        return jsonify({'success': False, 'message': 'ログインしてください'}), 403
+    return jsonify(backup.list_backups(database.db_path()))
+
+# バックアップ作成API（管理用）。ジョブとして実行し、進捗は /api/jobs/<id> で確認する
+@app.route('/api/admin/backups', methods=['POST'])
+def api_create_backup():
+    if not is_role_logged_in():
+        return jsonify({'success': False, 'message': 'ログインしてください'}), 403
+    record = jobs.enqueue('backup_database', keep=app.config.get('BACKUP_KEEP', backup.DEFAULT_KEEP))
+    return jsonify(jobs.job_to_dict(record)), 202
+
+# 読み取り用スナップショットの状態API（管理用）
+@app.route('/api/admin/replica')
+def api_replica_status():
+    if not is_role_logged_in():
+        return jsonify({'success': False, 'message': 'ログインしてください'}), 403
+    return jsonify(read_replica.status())
+
+# 案件別ダッシュボード（全社）
+@app.route('/projects')
+def projects_page():
+    month = datetime.now().strftime('%Y-%m')
+    return render_template('projects.html', month_from=f'{month[:4]}-01', month_to=month)
+
+# 案件別の時間・金額API（project_monthly を読む）
+@app.route('/api/projects/rollup')
+def api_project_rollup():
+    """
+    全社の案件別の時間・金額を月ごとに返すAPI。
+
+    Args:
+        from (str): 開始月 'YYYY-MM'。省略時は今年の1月。
+        to (str): 終了月 'YYYY-MM'。省略時は今月。
+        title (str): 指定するとその案件の社員別にする。
+
+    Returns:
+        JSONオブジェクト:
+            {
+                "months": 月の配列, "rows": 件名（または社員）の配列,
+                "minutes", "amount": [行][月] の2次元配列（分・円）,
+                "total_minutes", "total_amount": 行ごとの合計
+            }
+    """
+    month = datetime.now().strftime('%Y-%m')
+    month_from = request.args.get('from') or f'{month[:4]}-01'
+    month_to = request.args.get('to') or month
+    try:
+        datetime.strptime(month_from, '%Y-%m')
+        datetime.strptime(month_to, '%Y-%m')
+        result = projects.dashboard(month_from, month_to, request.args.get('title'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result)
+
+# 案件・単価の一覧API
+@app.route('/api/projects')
+def api_projects():
+    return jsonify([projects.project_to_dict(p) for p in Project.query.order_by(Project.title)])
+
+# 案件の単価登録API（管理用）
+@app.route('/api/projects', methods=['POST'])
+def api_set_project_rate():
+    """
+    Args:
+        JSON: {"title": 件名, "hourly_rate": 時間単価（円）, "valid_from": "YYYY-MM", "client": 取引先}
+    """
+    if not is_role_logged_in():
+        return jsonify({'success': False, 'message': 'ログインしてください'}), 403
+
+    data = request.get_json() or {}
+    title = (data.get('title') or '').strip()
+    valid_from = data.get('valid_from') or ''
+    try:
+        datetime.strptime(valid_from, '%Y-%m')
+        hourly_rate = int(data.get('hourly_rate'))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': '単価と適用開始月（YYYY-MM）を指定してください'}), 400
+    if not title or hourly_rate < 0:
+        return jsonify({'success': False, 'message': '件名と0以上の単価を指定してください'}), 400
+
+    project = projects.set_rate(title, hourly_rate, valid_from, data.get('client'))
+    db.session.commit()
+    return jsonify(projects.project_to_dict(project))
+
+# 同時リクエストのまとめ（single-flight）の状態API（管理用）
+@app.route('/api/admin/single_flight')
+def api_single_flight_status():
+    if not is_role_logged_in():
+        return jsonify({'success': False, 'message': 'ログインしてください'}), 403
+    return jsonify(single_flight.status())
+
 # 月報用ルート
 @app.route('/monthly_report')
 def monthly_report():
-    # name = request.args.get('name')
-    # # month = request.args.get('month')
-    # reports = DailyReport.query.filter(
-    #     DailyReport.name == name,
-    #     # DailyReport.date.startswith(month)
-    # ).all()
-
-    # # 集計ロジック
-    # grouped = ...
-
-    # return render_template('monthly_report.html',
-    #                        name=name,
-    #                     #    month=month,
-    #                        reports=reports,
-    #                        grouped=grouped)
-    performance_rate = round((258850 / 1091200) * 100, 2)
-    context = {
-        "name": "田中",
-        "month": "2025-07",
-        "basic_time": "22 日",
-        "overtime_a": "2.5 H",
-        "overtime_b": "0 H",
-        "holiday_work": "8.5 H",
-        "total_hours": 179,  # 総合計時間
-        "paid_leave": "0 日",
-        "time_diff": "-8 H",
-        "late_early": "0 H",
-        "target_amount": 1091200,
-        "actual_amount": 258850,  # 総合計金額
-        "performance_rate": performance_rate,
-        "main_tasks": [
-            {"project_name": "東山中高", "description": "弱電迂回工事 / 水野", "hours": 23, "amount": 0},
-        ],
-        "main_total_hours": 72,
-        "main_total_amount": 0,
-        "other_tasks": [
-            {"category": "社内", "description": "プログラミング学習 他", "hours": 56, "amount": 0},
-            {"category": "電設", "description": "枚方長尾谷NKビル 他", "hours": 17, "amount": 18600},
-        ],
-        "other_total_hours": 73,
-        "other_total_amount": 104850,
-        "previous_amount": 155000,
-    }
+    name = request.args.get('name', '')
+    month = request.args.get('month') or datetime.now().strftime('%Y-%m')
+
+    if name:
+        figures, previous = monthly.project_figures_for(month, name)
+        context = monthly.build_context(name, month, [
+            r for r in fetch_reports(name=name, month=month) if r.name == name
+        ], rules=work_rules(), project_figures=figures.get(name, {}),
+            previous_amount=previous.get(name, 0))
+    else:
+        context = monthly.empty_context(name, month)
     return render_template("monthly_report.html", **context)
 
+# 月報一括出力（zip）のダウンロード
+# 出力は /api/jobs に kind=render_monthly_reports, params={"month": "YYYY-MM"} で登録する
+@app.route('/monthly_report/download')
+def download_monthly_reports():
+    if not is_role_logged_in():
+        return jsonify({'success': False, 'message': 'ログインしてください'}), 403
+    month = request.args.get('month', '')
+    try:
+        monthly.validate_month(month)
+    except ValueError:
+        return jsonify({'success': False, 'message': '月は YYYY-MM で指定してください'}), 400
+    zip_path = os.path.join(monthly.export_dir_for(database.db_path()), f'monthly_{month}.zip')
+    if not os.path.exists(zip_path):
+        abort(404)
+    return send_file(zip_path, as_attachment=True, download_name=f'monthly_{month}.zip')
+
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
@@ -0,0 +1,327 @@
+import os
+import re
+import sqlite3
+import argparse
+from datetime import date as dt_date, datetime
+
+# 年度の開始月（4月始まり）
+FISCAL_YEAR_START_MONTH = 4
+
+# アーカイブファイル名（例: daily_reports_2023.db → 2023年度）
+ARCHIVE_FILE_PATTERN = re.compile(r'^daily_reports_(\d{4})\.db$')
+
+
+def archive_dir_for(db_path):
+    """本番DBと同じ階層の archive ディレクトリ"""
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), 'archive')
+
+
+def archive_path_for(db_path, fiscal_year):
+    return os.path.join(archive_dir_for(db_path), f'daily_reports_{fiscal_year}.db')
+
+
+def fiscal_year_range(fiscal_year):
+    """年度の開始日と終了日（'YYYY-MM-DD'）を返す"""
+    start = dt_date(fiscal_year, FISCAL_YEAR_START_MONTH, 1)
+    end = dt_date(fiscal_year + 1, FISCAL_YEAR_START_MONTH, 1)
+    # 終了日は翌年度開始日の前日
+    end = dt_date.fromordinal(end.toordinal() - 1)
+    return start.isoformat(), end.isoformat()
+
+
+def fiscal_year_of(date_str):
+    """'YYYY-MM-DD' の日付が属する年度"""
+    year, month = int(date_str[:4]), int(date_str[5:7])
+    return year if month >= FISCAL_YEAR_START_MONTH else year - 1
+
+
+def current_fiscal_year():
+    return fiscal_year_of(dt_date.today().isoformat())
+
+
+def archived_years(db_path):
+    """アーカイブ済みの年度一覧（昇順）"""
+    directory = archive_dir_for(db_path)
+    if not os.path.isdir(directory):
+        return []
+    years = []
+    for filename in os.listdir(directory):
+        m = ARCHIVE_FILE_PATTERN.match(filename)
+        if m:
+            years.append(int(m.group(1)))
+    return sorted(years)
+
+
+def years_in_range(db_path, date_from=None, date_to=None):
+    """指定期間にかかるアーカイブ年度。期間指定なしなら全アーカイブ"""
+    years = archived_years(db_path)
+    if date_from:
+        years = [y for y in years if fiscal_year_range(y)[1] >= date_from]
+    if date_to:
+        years = [y for y in years if fiscal_year_range(y)[0] <= date_to]
+    return years
+
+
+def archive_fiscal_year(db_path, fiscal_year):
+    """
+    締め済み年度の daily_reports をアーカイブファイルへ移動する。
+
+    本番DBは WAL なので、ATTACH した2つのDBにまたがるトランザクションは
+    プロセスが落ちたときに原子的にならない。そのため2段階で行う。
+
+    1. アーカイブへコピーしてコミットし、本番の対象行がすべて同じ内容でアーカイブにあるか確かめる
+    2. 別のトランザクションで、アーカイブに同じ内容がある行だけを本番から消す
+
+    1 と 2 の間で落ちても行は消えず、再実行すると同じ内容の行はコピーし直さない
+    （途中で書き換えられた行は、アーカイブ側を新しい内容で置き換える）。
+    2 の前に書き換えられた行は本番に残り、次に実行したときに移る。
+    VACUUM はここでは行わない（vacuum() を参照）。
+
+    Returns:
+        int: 移動した行数
+    """
+    if fiscal_year >= current_fiscal_year():
+        raise ValueError(f'{fiscal_year}年度はまだ締まっていません')
+
+    start, end = fiscal_year_range(fiscal_year)
+    path = archive_path_for(db_path, fiscal_year)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        # 本番と同じテーブル定義をアーカイブ側に作る
+        create_sql = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type='table' AND name='daily_reports'"
+        ).fetchone()[0]
+        if os.path.exists(path):
+            os.chmod(path, 0o644)
+        conn.execute('ATTACH DATABASE ? AS arc', (path,))
+        exists = conn.execute(
+            "SELECT 1 FROM arc.sqlite_master WHERE type='table' AND name='daily_reports'"
+        ).fetchone()
+        if not exists:
+            conn.execute(re.sub(r'^CREATE TABLE\s+["`\[]?daily_reports["`\]]?',
+                                'CREATE TABLE arc.daily_reports', create_sql))
+            conn.execute('CREATE INDEX arc.ix_daily_reports_date_name ON daily_reports (date, name)')
+
+        columns = [row[1] for row in conn.execute('PRAGMA main.table_info(daily_reports)')]
+        column_sql = ', '.join(columns)
+        # アーカイブに同じ内容の行がある（NULL 同士も同じとみなす）
+        copied = ('EXISTS (SELECT 1 FROM arc.daily_reports a WHERE '
+                  + ' AND '.join(f'a.{c} IS m.{c}' for c in columns) + ')')
+
+        # 1. アーカイブへのコピー（書き込むのはアーカイブだけ）
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                f'INSERT OR REPLACE INTO arc.daily_reports ({column_sql}) '
+                f'SELECT {column_sql} FROM main.daily_reports m '
+                f'WHERE m.date BETWEEN ? AND ? AND NOT {copied}', (start, end))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        missing = conn.execute(
+            f'SELECT COUNT(*) FROM main.daily_reports m WHERE m.date BETWEEN ? AND ? AND NOT {copied}',
+            (start, end)).fetchone()[0]
+        if missing:
+            raise RuntimeError(f'{fiscal_year}年度: {missing}件がアーカイブにコピーできていません')
+
+        # 2. 本番からの削除（書き込むのは本番だけ）
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # 本番テーブルから消えたことを change_log に残す（差分同期の相手が消せるように）
+            has_change_log = conn.execute(
+                "SELECT 1 FROM main.sqlite_master WHERE type='table' AND name='change_log'"
+            ).fetchone()
+            if has_change_log:
+                conn.execute(
+                    "INSERT INTO main.change_log (table_name, row_key, op, data, changed_at) "
+                    "SELECT 'daily_reports', CAST(m.id AS TEXT), 'delete', NULL, ? "
+                    f"FROM main.daily_reports m WHERE m.date BETWEEN ? AND ? AND {copied}",
+                    (datetime.now().isoformat(sep=' ', timespec='microseconds'), start, end))
+            moved = conn.execute(
+                f'DELETE FROM main.daily_reports AS m WHERE m.date BETWEEN ? AND ? AND {copied}',
+                (start, end)).rowcount
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        conn.execute('DETACH DATABASE arc')
+    finally:
+        conn.close()
+
+    # アーカイブは編集しないので読み取り専用にしておく
+    os.chmod(path, 0o444)
+    return moved
+
+
+def vacuum(db_path):
+    """
+    アーカイブで空いた領域を詰める（本番テーブルとインデックスを小さく保つ）。
+    アプリが DB を使っている間は失敗することがあるので、失敗しても移動の結果には影響させない。
+
+    Returns:
+        bool: VACUUM できたか
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=5)
+    try:
+        conn.execute('VACUUM')
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+
+def open_reader(db_path, fiscal_years):
+    """
+    本番DBに指定年度のアーカイブを読み取り専用で ATTACH した接続を返す。
+    スキーマ名は arc_<年度>。
+    """
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    conn.row_factory = sqlite3.Row
+    for year in fiscal_years:
+        conn.execute(f'ATTACH DATABASE ? AS arc_{year}',
+                     (f'file:{archive_path_for(db_path, year)}?mode=ro',))
+    return conn
+
+
+def union_source(conn, fiscal_years, columns, table='daily_reports'):
+    """
+    本番テーブルとアーカイブを UNION ALL したサブクエリ。
+    アーカイブ後に追加された列はアーカイブ側では NULL として扱う。
+    archived（0/1）と archive_year（アーカイブの年度。本番は NULL）の列が付く。
+    """
+    column_sql = ', '.join(columns)
+    parts = [f'SELECT {column_sql}, 0 AS archived, NULL AS archive_year FROM main.{table}']
+    for year in fiscal_years:
+        existing = {row[1] for row in conn.execute(f'PRAGMA arc_{year}.table_info({table})')}
+        selected = ', '.join(c if c in existing else f'NULL AS {c}' for c in columns)
+        parts.append(f'SELECT {selected}, 1 AS archived, {year} AS archive_year FROM arc_{year}.{table}')
+    return '(' + ' UNION ALL '.join(parts) + ')'
+
+
+def query_reports(db_path, name=None, date=None, month=None):
+    """
+    日報を検索する（アプリコンテキスト内で呼ぶ）。指定日・指定月がアーカイブ済み年度に
+    かかる場合はアーカイブも UNION して返す（アーカイブ分は archived=True）。
+    """
+    from models import DailyReport
+
+    if date:
+        years = years_in_range(db_path, date, date)
+    elif month:
+        years = years_in_range(db_path, f'{month}-01', f'{month}-31')
+    else:
+        # 期間指定なしは本番テーブルだけ
+        years = []
+    if years:
+        return fetch_reports(db_path, years, name=name, date=date, month=month)
+
+    query = DailyReport.query
+    if name:
+        query = query.filter(DailyReport.name.contains(name))
+    if date:
+        query = query.filter(DailyReport.date == date)
+    if month:
+        query = query.filter(DailyReport.date.like(f'{month}-%'))
+    return query.order_by(DailyReport.date.desc(), DailyReport.name).all()
+
+
+def archived_id(fiscal_year, report_id):
+    """アーカイブの行の id（本番の id と区別できる文字列。例: 'a2023-15'）"""
+    return f'a{fiscal_year}-{report_id}'
+
+
+def fetch_reports(db_path, fiscal_years, name=None, date=None, month=None):
+    """
+    本番テーブルとアーカイブをまとめて検索し、DailyReport のリストを返す。
+    アーカイブ由来の行は archived=True になる（セッションには載らない）。
+    アーカイブの id は本番の id と重なることがあるので、id は archived_id() の文字列にし、
+    元の id は archived_source_id に入れる。
+    """
+    from models import DailyReport
+
+    columns = DailyReport.__table__.columns.keys()
+    where, params = _filters(name=name, date=date, month=month)
+    conn = open_reader(db_path, fiscal_years)
+    try:
+        source = union_source(conn, fiscal_years, columns)
+        rows = conn.execute(
+            f'SELECT * FROM {source} {where} ORDER BY date DESC, name', params).fetchall()
+    finally:
+        conn.close()
+
+    reports = []
+    for row in rows:
+        report = DailyReport(**{k: row[k] for k in columns})
+        report.archived = bool(row['archived'])
+        if report.archived:
+            report.archived_source_id = report.id
+            report.id = archived_id(row['archive_year'], report.id)
+        reports.append(report)
+    return reports
+
+
+def sum_minutes(db_path, fiscal_years, column, name=None, month=None):
+    """本番テーブルとアーカイブをまとめた列の合計"""
+    where, params = _filters(exact_name=name, month=month)
+    conn = open_reader(db_path, fiscal_years)
+    try:
+        source = union_source(conn, fiscal_years, ['name', 'date', column])
+        return conn.execute(f'SELECT SUM({column}) FROM {source} {where}', params).fetchone()[0] or 0
+    finally:
+        conn.close()
+
+
+def _filters(name=None, exact_name=None, date=None, month=None):
+    clauses, params = [], []
+    if name:
+        clauses.append("name LIKE '%' || ? || '%'")
+        params.append(name)
+    if exact_name:
+        clauses.append('name = ?')
+        params.append(exact_name)
+    if date:
+        clauses.append('date = ?')
+        params.append(date)
+    if month:
+        clauses.append('date LIKE ?')
+        params.append(f'{month}-%')
+    where = ('WHERE ' + ' AND '.join(clauses)) if clauses else ''
+    return where, params
+
+
+def main():
+    from database import DB_PATH
+
+    parser = argparse.ArgumentParser(description='締め済み年度の日報をアーカイブする')
+    parser.add_argument('fiscal_year', type=int, nargs='*', help='アーカイブする年度（例: 2023）')
+    parser.add_argument('--list', action='store_true', help='アーカイブ済み年度を表示')
+    parser.add_argument('--no-vacuum', action='store_true', help='移動後に VACUUM しない')
+    parser.add_argument('--vacuum-only', action='store_true', help='VACUUM だけを行う')
+    args = parser.parse_args()
+
+    if args.vacuum_only:
+        print('✅ VACUUM しました' if vacuum(DB_PATH) else '⚠ VACUUM できませんでした（DB が使用中）')
+        return
+
+    if args.list or not args.fiscal_year:
+        for year in archived_years(DB_PATH):
+            start, end = fiscal_year_range(year)
+            print(f'{year}年度  {start} 〜 {end}  {archive_path_for(DB_PATH, year)}')
+        return
+
+    moved = 0
+    for year in args.fiscal_year:
+        count = archive_fiscal_year(DB_PATH, year)
+        moved += count
+        print(f'✅ {year}年度: {count}件をアーカイブしました')
+    if moved and not args.no_vacuum and not vacuum(DB_PATH):
+        print('⚠ VACUUM できませんでした（DB が使用中）。空いている時間に --vacuum-only で実行してください')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,347 @@
+import os
+import time
+import random
+import argparse
+import tempfile
+from sqlalchemy import text
+from models import db, DailyReport, CalendarDay
+import calendar_days
+import changelog
+import database
+import jobs
+import projects
+import worktime
+
+# daily_reports の保存済み合計が内訳と合っているかを調べ、必要なら直す。
+# 判定も修正も id の範囲ごとに SQL でまとめて行う（1行ずつ Python に読み込まない）。
+
+# 1回に調べる id の幅
+DEFAULT_CHUNK_SIZE = 50000
+# 問題ごとにレポートへ載せる id の数
+DEFAULT_SAMPLE_SIZE = 10
+
+# 作業時間が空の通常勤務の行は、合計があれば 合計 − 前残業 − 後残業、
+# 合計も空なら worktime と同じく開始〜終了から休憩を引いた時間とみなす。
+# どちらも求められない行（合計が残業より少ない・時刻も無い）は NULL のままにして報告だけする。
+# 休憩時間帯は就業ルールで変わるので {derived_work} は run() で埋める
+_REMAINDER = '(d.total_minutes - COALESCE(d.overtime_before, 0) - COALESCE(d.overtime_after, 0))'
+_WORK_NORMAL = (
+    'COALESCE(d.work_minutes, CASE WHEN d.total_minutes IS NOT NULL '
+    f'THEN (CASE WHEN {_REMAINDER} >= 0 THEN {_REMAINDER} END) '
+    'ELSE {derived_work} END)'
+)
+# 作業時間が求められない行では NULL になる（合計の比較・修正の対象から外れる）
+_SUM_NORMAL = f'COALESCE(d.overtime_before, 0) + {_WORK_NORMAL} + COALESCE(d.overtime_after, 0)'
+_SUM_HOLIDAY = 'COALESCE(d.overtime_before, 0) + COALESCE(d.holiday_work_minutes, 0) + COALESCE(d.overtime_after, 0)'
+_IS_HOLIDAY = 'COALESCE(d.is_holiday_work, 0) = 1'
+_FORCED_PAIDLEAVE = (
+    "d.date IN (SELECT c.date FROM calendar_days c WHERE c.day_type = 'paidleave')"
+)
+
+# (名前, 説明, 問題のある行の条件, 修正内容（None は報告だけ）)
+# 修正は上から順に行う（先に NULL を埋め、列の取り違えを直してから合計を計算し直す）
+CHECKS = (
+    (
+        'null_components',
+        '内訳・合計が NULL（表示時に 0 として扱われている）',
+        f'(NOT {_IS_HOLIDAY} AND ((d.work_minutes IS NULL AND {_WORK_NORMAL} IS NOT NULL) '
+        f'OR (d.total_minutes IS NULL AND {_SUM_NORMAL} IS NOT NULL))) '
+        f'OR ({_IS_HOLIDAY} AND (d.holiday_work_minutes IS NULL OR d.holiday_total_minutes IS NULL)) '
+        'OR d.overtime_before IS NULL OR d.overtime_after IS NULL OR d.paid_leave_minutes IS NULL',
+        'overtime_before = COALESCE(d.overtime_before, 0), '
+        'overtime_after = COALESCE(d.overtime_after, 0), '
+        'paid_leave_minutes = COALESCE(d.paid_leave_minutes, 0), '
+        f'work_minutes = CASE WHEN {_IS_HOLIDAY} THEN d.work_minutes ELSE {_WORK_NORMAL} END, '
+        # 合計は空のときだけ内訳から作る（入力済みの合計は変えない）
+        f'total_minutes = CASE WHEN {_IS_HOLIDAY} THEN d.total_minutes '
+        f'WHEN d.total_minutes IS NULL THEN {_SUM_NORMAL} '
+        'ELSE d.total_minutes END, '
+        f'holiday_work_minutes = CASE WHEN {_IS_HOLIDAY} '
+        'THEN COALESCE(d.holiday_work_minutes, 0) ELSE d.holiday_work_minutes END, '
+        f'holiday_total_minutes = CASE WHEN {_IS_HOLIDAY} '
+        'THEN COALESCE(d.holiday_total_minutes, 0) ELSE d.holiday_total_minutes END',
+    ),
+    (
+        'work_underivable',
+        '通常勤務の作業時間が NULL で、合計からも時刻からも求められない（手で確認する）',
+        f'NOT {_IS_HOLIDAY} AND {_WORK_NORMAL} IS NULL',
+        None,
+    ),
+    (
+        'holiday_columns_on_normal',
+        '通常勤務の行に休日出勤の列が入っている',
+        f'NOT {_IS_HOLIDAY} AND (COALESCE(d.holiday_work_minutes, 0) != 0 '
+        'OR COALESCE(d.holiday_total_minutes, 0) != 0 OR d.holiday_start_hour IS NOT NULL '
+        'OR d.holiday_end_hour IS NOT NULL)',
+        'holiday_work_minutes = NULL, holiday_total_minutes = NULL, '
+        'holiday_start_hour = NULL, holiday_start_minute = NULL, '
+        'holiday_end_hour = NULL, holiday_end_minute = NULL',
+    ),
+    (
+        'normal_columns_on_holiday',
+        '休日出勤の行に通常勤務の列（作業時間・合計・有休）が入っている',
+        f'{_IS_HOLIDAY} AND (COALESCE(d.work_minutes, 0) != 0 OR COALESCE(d.total_minutes, 0) != 0 '
+        'OR COALESCE(d.paid_leave_minutes, 0) != 0 OR d.start_hour IS NOT NULL OR d.end_hour IS NOT NULL)',
+        'work_minutes = NULL, total_minutes = NULL, paid_leave_minutes = 0, '
+        'start_hour = NULL, start_minute = NULL, end_hour = NULL, end_minute = NULL',
+    ),
+    (
+        'normal_total_mismatch',
+        '通常勤務の合計が 前残業＋作業時間＋後残業 と合わない',
+        f'NOT {_IS_HOLIDAY} AND COALESCE(d.total_minutes, 0) != {_SUM_NORMAL}',
+        f'total_minutes = {_SUM_NORMAL}',
+    ),
+    (
+        'holiday_total_mismatch',
+        '休日出勤の合計が 前残業＋休日作業時間＋後残業 と合わない',
+        f'{_IS_HOLIDAY} AND COALESCE(d.holiday_total_minutes, 0) != {_SUM_HOLIDAY}',
+        f'holiday_total_minutes = {_SUM_HOLIDAY}',
+    ),
+    (
+        'forced_paidleave_mismatch',
+        '指定有給日の有休が 所定時間 −（前残業＋作業時間＋後残業）と合わない',
+        f'NOT {_IS_HOLIDAY} AND {_FORCED_PAIDLEAVE} '
+        f'AND COALESCE(d.paid_leave_minutes, 0) != MAX(0, :standard - ({_SUM_NORMAL}))',
+        f'paid_leave_minutes = MAX(0, :standard - ({_SUM_NORMAL}))',
+    ),
+)
+
+CHECK_NAMES = tuple(name for name, *_ in CHECKS)
+
+
+def _chunks(chunk_size):
+    low, high = db.session.query(db.func.min(DailyReport.id), db.func.max(DailyReport.id)).one()
+    if low is None:
+        return
+    for start in range(low, high + 1, chunk_size):
+        yield start, start + chunk_size - 1
+
+
+# 1回の IN (...) に入れる id の数（SQLite のバインド変数の上限より十分小さく）
+ID_BATCH_SIZE = 900
+
+
+def _batches(ids, size=ID_BATCH_SIZE):
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def _calendar_years():
+    """日報のある年（指定有給日の判定に calendar_days が必要な年）"""
+    first, last = db.session.query(db.func.min(DailyReport.date), db.func.max(DailyReport.date)).one()
+    if not first:
+        return []
+    try:
+        return list(range(int(first[:4]), int(last[:4]) + 1))
+    except ValueError:
+        return []
+
+
+def _missing_calendar_years(years):
+    return [
+        year for year in years
+        if not db.session.query(CalendarDay.date)
+        .filter(CalendarDay.date.between(f'{year}-01-01', f'{year}-12-31')).first()
+    ]
+
+
+def run(repair=False, checks=CHECK_NAMES, chunk_size=DEFAULT_CHUNK_SIZE,
+        sample_size=DEFAULT_SAMPLE_SIZE, rules=worktime.DEFAULT_RULES, progress=None):
+    """
+    すべての行を調べる（repair=True なら同じ範囲を続けて直す）。
+    チャンクごとにコミットするので、途中で止めてもそこまでの修正は残る。
+
+    Returns:
+        dict: 問題ごとの件数・id の例・修正件数、調べた行数と所要時間
+    """
+    started = time.perf_counter()
+    # 確認だけのときは何も書き込まない（calendar_days が無い年は結果に載せるだけ）
+    years = _calendar_years()
+    if repair:
+        calendar_days.ensure_years(*years)
+        missing_years = []
+    else:
+        missing_years = _missing_calendar_years(years)
+    derived_work = worktime.derived_work_sql(rules, 'd.')
+    selected = [
+        (name, description, cond.format(derived_work=derived_work),
+         fix and fix.format(derived_work=derived_work))
+        for name, description, cond, fix in CHECKS if name in checks
+    ]
+    params = {'standard': rules.standard_day_minutes}
+    report = {
+        name: {'description': description, 'count': 0, 'sample_ids': [], 'repaired': 0}
+        for name, description, _, _ in selected
+    }
+
+    counts_sql = text(
+        'SELECT COUNT(*), ' + ', '.join(f'COALESCE(SUM(CASE WHEN {cond} THEN 1 ELSE 0 END), 0)'
+                                        for _, _, cond, _ in selected)
+        + ' FROM daily_reports d WHERE d.id BETWEEN :low AND :high')
+
+    chunks = list(_chunks(chunk_size))
+    scanned = 0
+    for done, (low, high) in enumerate(chunks, 1):
+        bounds = dict(params, low=low, high=high)
+        rows, *counts = db.session.execute(counts_sql, bounds).one()
+        scanned += rows
+
+        touched = set()
+        for (name, _, cond, fix), count in zip(selected, counts):
+            if not count:
+                continue
+            entry = report[name]
+            entry['count'] += count
+            if len(entry['sample_ids']) < sample_size:
+                entry['sample_ids'] += db.session.execute(
+                    text(f'SELECT d.id FROM daily_reports d WHERE d.id BETWEEN :low AND :high '
+                         f'AND ({cond}) ORDER BY d.id LIMIT :limit'),
+                    dict(bounds, limit=sample_size - len(entry['sample_ids']))).scalars().all()
+            if repair and fix:
+                ids = db.session.execute(
+                    text(f'UPDATE daily_reports AS d SET {fix}, version = version + 1 '
+                         f'WHERE d.id BETWEEN :low AND :high AND ({cond}) RETURNING id'),
+                    bounds).scalars().all()
+                entry['repaired'] += len(ids)
+                touched.update(ids)
+
+        if touched:
+            touched = sorted(touched)
+            for ids in _batches(touched):
+                changelog.record_updates(DailyReport, ids)
+            # 一括 UPDATE は差分更新の対象外なので、直した月の案件別集計を作り直す
+            projects.rebuild_for_ids(database.db_path(), touched, ID_BATCH_SIZE)
+        db.session.commit()
+        db.session.expunge_all()
+        if progress:
+            progress(done, len(chunks))
+
+    return {
+        'scanned': scanned,
+        'seconds': round(time.perf_counter() - started, 3),
+        'repair': repair,
+        'checks': report,
+        # calendar_days が無く、指定有給日の確認ができなかった年（--repair で作られる）
+        'calendar_missing_years': missing_years,
+    }
+
+
+@jobs.job('audit_daily_reports')
+def audit_daily_reports_job(ctx, repair=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    from flask import current_app
+
+    def progress(done, total):
+        ctx.check_cancelled()
+        ctx.progress(done, total, '修正中' if repair else '確認中')
+
+    return run(bool(repair), chunk_size=int(chunk_size),
+               rules=worktime.WorkRules.from_config(current_app.config), progress=progress)
+
+
+# ---- 計測 ----
+
+def make_synthetic_rows(rows, broken_ratio=0.02, seed=0):
+    """計測用の日報を rows 件入れる（broken_ratio の割合で内訳と合わない行を混ぜる）"""
+    rng = random.Random(seed)
+    columns = ('name', 'title', 'date', 'work_minutes', 'overtime_before', 'overtime_after',
+               'total_minutes', 'paid_leave_minutes', 'is_holiday_work',
+               'holiday_work_minutes', 'holiday_total_minutes')
+    sql = text(f'INSERT INTO daily_reports ({", ".join(columns)}) '
+               f'VALUES ({", ".join(":" + c for c in columns)})')
+    batch = []
+    for i in range(rows):
+        holiday = rng.random() < 0.05
+        work, before, after = rng.choice((60, 120, 180)), rng.choice((0, 30)), rng.choice((0, 60))
+        total = before + work + after
+        if rng.random() < broken_ratio:
+            total = rng.choice((None, total + 30))
+        batch.append({
+            'name': f'社員{i % 200:03d}', 'title': f'案件{i % 97}',
+            'date': f'{2020 + i % 6}-{1 + i % 12:02d}-{1 + i % 28:02d}',
+            'work_minutes': None if holiday else work, 'overtime_before': before, 'overtime_after': after,
+            'total_minutes': None if holiday else total, 'paid_leave_minutes': 0,
+            'is_holiday_work': holiday,
+            'holiday_work_minutes': work if holiday else None,
+            'holiday_total_minutes': total if holiday else None,
+        })
+        if len(batch) == 50000:
+            db.session.execute(sql, batch)
+            batch = []
+    if batch:
+        db.session.execute(sql, batch)
+    db.session.commit()
+
+
+def benchmark(rows=2_000_000):
+    """一時DBに rows 件入れて、確認だけ・修正ありのそれぞれの所要時間を測る"""
+    from flask import Flask
+    import database
+
+    work = tempfile.mkdtemp(prefix='audit-bench-')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(work, "unified.db")}'
+    database.init_app(app)
+    try:
+        with app.app_context():
+            db.create_all()
+            make_synthetic_rows(rows)
+            check = run()
+            fix = run(repair=True)
+            again = run()
+            db.engine.dispose()
+        return {
+            'rows': rows,
+            'check_seconds': check['seconds'],
+            'repair_seconds': fix['seconds'],
+            'found': {name: c['count'] for name, c in check['checks'].items()},
+            'left_after_repair': sum(c['count'] for c in again['checks'].values()),
+        }
+    finally:
+        for filename in os.listdir(work):
+            os.remove(os.path.join(work, filename))
+        os.rmdir(work)
+
+
+def print_report(result):
+    print(f"{result['scanned']:,}行を{result['seconds']}秒で確認しました"
+          f"{'（修正あり）' if result['repair'] else ''}")
+    for name, entry in result['checks'].items():
+        line = f"  {name:<28} {entry['count']:>8,}件"
+        if result['repair']:
+            line += f"  修正 {entry['repaired']:,}件"
+        print(f"{line}  {entry['description']}")
+        if entry['sample_ids']:
+            print(f"      例: id {', '.join(map(str, entry['sample_ids']))}")
+    if result['calendar_missing_years']:
+        print(f"  ※ calendar_days が無い年は指定有給日を確認していません: "
+              f"{', '.join(map(str, result['calendar_missing_years']))}")
+
+
+def main():
+    import json
+    from database import create_app
+
+    parser = argparse.ArgumentParser(description='日報の合計時間の整合性チェック')
+    parser.add_argument('--repair', action='store_true', help='見つかった問題を直す')
+    parser.add_argument('--check', action='append', choices=CHECK_NAMES, help='調べる項目（複数指定可）')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--json', action='store_true', help='結果を JSON で出力する')
+    parser.add_argument('--bench', type=int, metavar='ROWS', help='一時DBで所要時間を測る')
+    args = parser.parse_args()
+
+    if args.bench:
+        print(json.dumps(benchmark(args.bench), ensure_ascii=False, indent=2))
+        return
+
+    app = create_app()
+    with app.app_context():
+        result = run(args.repair, checks=args.check or CHECK_NAMES, chunk_size=args.chunk_size,
+                     rules=worktime.WorkRules.from_config(app.config))
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print_report(result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+import os
+import time
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+import sqlalchemy as sa
+
+# 大きなテーブルのデータ移行（バックフィル）を、短いトランザクションに分けて行う。
+#
+# マイグレーションから使う例（列の追加は batch_alter_table を使わず op.add_column にすると
+# SQLite でもテーブルのコピーが起きない）:
+#
+#     import backfill
+#
+#     def upgrade():
+#         op.add_column('daily_reports', sa.Column('work_hours', sa.Float(), nullable=True))
+#         backfill.run_in_migration(
+#             'daily_reports_work_hours', 'daily_reports',
+#             'work_hours = work_minutes / 60.0',
+#             where='work_hours IS NULL')
+#
+# 途中で止まっても backfill_checkpoints に残った位置から再開する。
+# 同じバッチを2回実行しても結果が変わらないように where で絞ること。
+#
+# UPDATE は ORM を通らないので、セッションのフック（change_log・案件別集計）は動かない。
+# TRACKERS にあるテーブル（daily_reports）は、バッチごとに同じトランザクションで
+# change_log を書き、その範囲の月の project_monthly を作り直す。
+
+# 1バッチで更新する行数
+DEFAULT_BATCH_SIZE = 2000
+# バッチ間の最短の待ち時間（秒）
+DEFAULT_PAUSE = 0.01
+# 処理に使う時間の割合（0.5 なら、バッチにかかったのと同じ時間だけ休む）
+DEFAULT_DUTY_CYCLE = 0.5
+
+CHECKPOINT_TABLE = 'backfill_checkpoints'
+
+_now = sa.bindparam('now', type_=sa.DateTime())
+
+
+def _begin(conn):
+    # 書き込みロックをバッチの最初に取る（途中で別の書き込みとぶつかって失敗しないように）
+    conn.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def get_checkpoint(conn, name):
+    row = conn.execute(sa.text(
+        f'SELECT name, table_name, last_key, rows_done, batches, started_at, updated_at, finished_at '
+        f'FROM {CHECKPOINT_TABLE} WHERE name = :name'), {'name': name}).mappings().first()
+    return dict(row) if row else None
+
+
+def _months_in_range(conn, key, last, upper):
+    return {m for (m,) in conn.execute(sa.text(
+        f'SELECT DISTINCT substr(date, 1, 7) FROM daily_reports '
+        f'WHERE {key} > :last AND {key} <= :upper AND date IS NOT NULL'),
+        {'last': last, 'upper': upper})}
+
+
+def track_daily_reports(conn, key, last, upper):
+    """
+    daily_reports の1バッチの UPDATE の前に呼ぶ。UPDATE した id を渡して呼ぶ関数を返し、
+    それが change_log を書いて、範囲内の（更新前と更新後の）月の project_monthly を作り直す。
+    """
+    import changelog
+    import projects
+    from models import DailyReport
+
+    months = _months_in_range(conn, key, last, upper)
+
+    def done(ids):
+        changelog.record_batch(conn, DailyReport, ids)
+        if ids:
+            projects.rebuild(conn.engine.url.database,
+                             months | _months_in_range(conn, key, last, upper), conn=conn)
+    return done
+
+
+# テーブル → バッチごとに派生データを更新する関数（track_daily_reports と同じ形）
+TRACKERS = {
+    'daily_reports': track_daily_reports,
+}
+# 楽観ロックの version 列を持つテーブル。更新した行の version を上げ、
+# 古い version のまま編集していた画面の保存がバックフィルした値を黙って上書きしないようにする
+VERSIONED_TABLES = ('daily_reports',)
+
+
+def backfill(conn, name, table, assignments, where=None, params=None, key='id',
+             batch_size=DEFAULT_BATCH_SIZE, pause=DEFAULT_PAUSE, duty_cycle=DEFAULT_DUTY_CYCLE,
+             max_seconds=None, progress=None, track=True):
+    """
+    table の行を key の昇順に batch_size 件ずつ UPDATE table SET assignments する。
+    1バッチ = 1トランザクションで、同じトランザクションで backfill_checkpoints に位置を書く。
+
+    Args:
+        conn: 自動コミット（AUTOCOMMIT）の SQLAlchemy 接続
+        name: バックフィル名。同じ名前で呼ぶと続きから再開し、終わっていれば何もしない
+        where: 更新する行の条件（SQL）。key の範囲の条件は自動で付く
+        duty_cycle: 処理に使う時間の割合（0 より大きく 1 以下）
+        max_seconds: これを超えたら途中で止める（次に呼んだときに続きから）
+        progress: progress(checkpoint) をバッチごとに呼ぶ
+        track: False にすると TRACKERS による change_log・集計の更新と、
+               VERSIONED_TABLES の version の更新をしない（計測用のテーブルなど、それらが無い DB で使う）
+
+    Returns:
+        dict: checkpoint の内容と、今回の実行の所要時間・完了したか
+    """
+    if not 0 < duty_cycle <= 1:
+        raise ValueError(f'duty_cycle は 0 より大きく 1 以下にしてください: {duty_cycle}')
+    tracker = TRACKERS.get(table) if track else None
+    if track and table in VERSIONED_TABLES:
+        assignments = f'{assignments}, version = version + 1'
+    started = time.perf_counter()
+    params = dict(params or {})
+    condition = f' AND ({where})' if where else ''
+
+    checkpoint = get_checkpoint(conn, name)
+    if checkpoint and checkpoint['finished_at']:
+        return dict(checkpoint, seconds=0.0, finished=True)
+    if checkpoint is None:
+        _begin(conn)
+        conn.execute(sa.text(
+            f'INSERT INTO {CHECKPOINT_TABLE} (name, table_name, last_key, rows_done, batches, '
+            f'started_at, updated_at) VALUES (:name, :table, NULL, 0, 0, :now, :now)').bindparams(_now),
+            {'name': name, 'table': table, 'now': datetime.now()})
+        conn.exec_driver_sql('COMMIT')
+        checkpoint = get_checkpoint(conn, name)
+
+    next_upper = sa.text(
+        f'SELECT MAX({key}) FROM (SELECT {key} FROM {table} WHERE {key} > :last '
+        f'ORDER BY {key} LIMIT :limit)')
+    update = sa.text(
+        f'UPDATE {table} SET {assignments} WHERE {key} > :last AND {key} <= :upper{condition} '
+        f'RETURNING {key}')
+    save = sa.text(
+        f'UPDATE {CHECKPOINT_TABLE} SET last_key = :upper, rows_done = rows_done + :rows, '
+        f'batches = batches + 1, updated_at = :now WHERE name = :name').bindparams(_now)
+
+    finished = False
+    while True:
+        last = checkpoint['last_key'] if checkpoint['last_key'] is not None else -1
+        upper = conn.execute(next_upper, {'last': last, 'limit': batch_size}).scalar()
+        if upper is None:
+            finished = True
+            break
+
+        batch_started = time.perf_counter()
+        _begin(conn)
+        try:
+            done = tracker(conn, key, last, upper) if tracker else None
+            ids = [i for (i,) in conn.execute(update, dict(params, last=last, upper=upper))]
+            rows = len(ids)
+            if done:
+                done(ids)
+            conn.execute(save, {'upper': upper, 'rows': rows, 'now': datetime.now(), 'name': name})
+            conn.exec_driver_sql('COMMIT')
+        except Exception:
+            conn.exec_driver_sql('ROLLBACK')
+            raise
+        elapsed = time.perf_counter() - batch_started
+
+        checkpoint.update(last_key=upper, rows_done=checkpoint['rows_done'] + rows,
+                          batches=checkpoint['batches'] + 1)
+        if progress:
+            progress(checkpoint)
+        if max_seconds is not None and time.perf_counter() - started > max_seconds:
+            break
+        # 他の書き込みが入れるように休む
+        time.sleep(max(pause, elapsed * (1 - duty_cycle) / duty_cycle))
+
+    if finished:
+        _begin(conn)
+        conn.execute(sa.text(
+            f'UPDATE {CHECKPOINT_TABLE} SET finished_at = :now, updated_at = :now '
+            f'WHERE name = :name').bindparams(_now), {'now': datetime.now(), 'name': name})
+        conn.exec_driver_sql('COMMIT')
+        checkpoint = get_checkpoint(conn, name)
+
+    return dict(checkpoint, seconds=round(time.perf_counter() - started, 3), finished=finished)
+
+
+def run_in_migration(name, table, assignments, **kwargs):
+    """
+    マイグレーションの upgrade() から呼ぶ。
+    マイグレーションのトランザクションをいったんコミットし、自動コミットの接続でバックフィルする。
+    """
+    from alembic import op
+
+    def report(checkpoint):
+        if checkpoint['batches'] % 50 == 0:
+            print(f"  {name}: {checkpoint['rows_done']:,}行 (id <= {checkpoint['last_key']})")
+
+    kwargs.setdefault('progress', report)
+    with op.get_context().autocommit_block():
+        return backfill(op.get_bind(), name, table, assignments, **kwargs)
+
+
+# ---- 計測 ----
+
+def _make_synthetic_table(conn, rows):
+    conn.exec_driver_sql(
+        f'CREATE TABLE {CHECKPOINT_TABLE} (name VARCHAR(100) PRIMARY KEY, table_name VARCHAR(50) NOT NULL, '
+        'last_key INTEGER, rows_done INTEGER, batches INTEGER, started_at DATETIME, '
+        'updated_at DATETIME, finished_at DATETIME)')
+    conn.exec_driver_sql(
+        'CREATE TABLE daily_reports (id INTEGER PRIMARY KEY, name VARCHAR(100), '
+        'work_minutes INTEGER, work_hours FLOAT)')
+    step = 100000
+    for offset in range(0, rows, step):
+        _begin(conn)
+        conn.exec_driver_sql(
+            'WITH RECURSIVE n(i) AS (SELECT ? UNION ALL SELECT i + 1 FROM n WHERE i < ?) '
+            "INSERT INTO daily_reports (name, work_minutes) SELECT '社員' || (i % 200), (i % 16) * 30 FROM n",
+            (offset, min(rows, offset + step) - 1))
+        conn.exec_driver_sql('COMMIT')
+
+
+def benchmark(rows=3_000_000, batch_size=DEFAULT_BATCH_SIZE, duty_cycle=DEFAULT_DUTY_CYCLE):
+    """
+    合成テーブルで、途中で止めて再開するバックフィルを行い、
+    所要時間と、その間の別接続の書き込みレイテンシを測る。
+    """
+    work = tempfile.mkdtemp(prefix='backfill-bench-')
+    path = os.path.join(work, 'unified.db')
+    engine = sa.create_engine(f'sqlite:///{path}', connect_args={'timeout': 30})
+    try:
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.exec_driver_sql('PRAGMA journal_mode=WAL')
+            _make_synthetic_table(conn, rows)
+
+            stop = threading.Event()
+            latencies = []
+
+            def writer():
+                with engine.connect() as w:
+                    while not stop.is_set():
+                        t = time.perf_counter()
+                        w.exec_driver_sql("INSERT INTO daily_reports (name, work_minutes) VALUES ('bench', 60)")
+                        w.commit()
+                        latencies.append(time.perf_counter() - t)
+                        time.sleep(0.01)
+
+            thread = threading.Thread(target=writer)
+            thread.start()
+            try:
+                kwargs = dict(where='work_hours IS NULL', batch_size=batch_size, duty_cycle=duty_cycle,
+                              track=False)
+                first = backfill(conn, 'bench', 'daily_reports', 'work_hours = work_minutes / 60.0',
+                                 max_seconds=1.0, **kwargs)
+                second = backfill(conn, 'bench', 'daily_reports', 'work_hours = work_minutes / 60.0',
+                                  **kwargs)
+            finally:
+                stop.set()
+                thread.join()
+            left = conn.exec_driver_sql(
+                'SELECT COUNT(*) FROM daily_reports WHERE work_hours IS NULL AND id <= ?',
+                (second['last_key'],)).scalar()
+
+        latencies.sort()
+        return {
+            'rows': rows,
+            'batch_size': batch_size,
+            'duty_cycle': duty_cycle,
+            'first_run': {'seconds': first['seconds'], 'rows_done': first['rows_done'],
+                          'finished': first['finished']},
+            'resumed_run': {'seconds': second['seconds'], 'rows_done': second['rows_done'],
+                            'batches': second['batches'], 'finished': second['finished']},
+            'rows_per_second': round(second['rows_done'] / (first['seconds'] + second['seconds'])),
+            'left_unfilled': left,
+            'write_latency_ms': {
+                'count': len(latencies),
+                'p50': round(latencies[len(latencies) // 2] * 1000, 2),
+                'p99': round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+                'max': round(latencies[-1] * 1000, 2),
+            },
+        }
+    finally:
+        engine.dispose()
+        for filename in os.listdir(work):
+            os.remove(os.path.join(work, filename))
+        os.rmdir(work)
+
+
+def main():
+    import json
+
+    parser = argparse.ArgumentParser(description='分割バックフィルの状態確認・計測')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('status', help='バックフィルの進み具合を表示')
+    p = sub.add_parser('reset', help='チェックポイントを消して最初からやり直せるようにする')
+    p.add_argument('name')
+    p = sub.add_parser('bench', help='合成テーブルで所要時間と書き込みへの影響を測る')
+    p.add_argument('--rows', type=int, default=3_000_000)
+    p.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    p.add_argument('--duty-cycle', type=float, default=DEFAULT_DUTY_CYCLE)
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        print(json.dumps(benchmark(args.rows, args.batch_size, args.duty_cycle), ensure_ascii=False, indent=2))
+        return
+
+    from database import create_app
+    from models import db, BackfillCheckpoint
+
+    app = create_app()
+    with app.app_context():
+        if args.command == 'status':
+            for c in BackfillCheckpoint.query.order_by(BackfillCheckpoint.started_at):
+                state = '完了' if c.finished_at else '途中'
+                print(f'{c.name:<32} {c.table_name:<16} {state}  {c.rows_done or 0:,}行  '
+                      f'id <= {c.last_key}  {c.updated_at}')
+        elif args.command == 'reset':
+            deleted = BackfillCheckpoint.query.filter_by(name=args.name).delete()
+            db.session.commit()
+            print(f'{deleted}件を削除しました')
+
+
+if __name__ == '__main__':
+    main()
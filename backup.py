@@ -0,0 +1,342 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+import jobs
+
+# 1ステップでコピーするページ数と、ステップ間の待ち時間（秒）
+# ステップの間は書き込みがブロックされないので、小さくするほど書き込みへの影響が減る
+DEFAULT_PAGES = 256
+DEFAULT_SLEEP = 0.005
+# 残すバックアップの数
+DEFAULT_KEEP = 14
+
+BACKUP_PREFIX = 'unified-'
+# 確認に失敗したバックアップを移す場所（backups の下。世代の数には入らない）
+FAILED_DIR = 'failed'
+
+
+def backup_dir_for(db_path):
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), 'backups')
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _manifest_path(backup_path):
+    return os.path.splitext(backup_path)[0] + '.json'
+
+
+def online_copy(src_path, dest_path, pages=DEFAULT_PAGES, sleep=DEFAULT_SLEEP, progress=None):
+    """
+    SQLite のオンラインバックアップAPIで src を dest にコピーする。
+    pages ページずつコピーし、ステップの合間に他の接続が書き込める。
+
+    WAL モードのときは最初に読み取りトランザクションを開いてスナップショットを固定する。
+    書き込みは WAL に入るので止まらず、途中で別の接続が書き込んでもコピーがやり直しにならない。
+    WAL でないときは、別の接続が書き込むたびに SQLite がコピーを最初からやり直す。
+    """
+    src = sqlite3.connect(src_path, isolation_level=None)
+    dest = sqlite3.connect(dest_path)
+    try:
+        if src.execute('PRAGMA journal_mode').fetchone()[0] == 'wal':
+            src.execute('BEGIN')
+            src.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+
+        def on_progress(status, remaining, total):
+            if progress:
+                progress(total - remaining, total)
+
+        src.backup(dest, pages=pages, progress=on_progress, sleep=sleep)
+        if src.in_transaction:
+            src.execute('COMMIT')
+    finally:
+        dest.close()
+        src.close()
+
+
+def create_backup(db_path, pages=DEFAULT_PAGES, sleep=DEFAULT_SLEEP, keep=DEFAULT_KEEP,
+                  verify=True, progress=None):
+    """
+    バックアップを作り、チェックサム付きの manifest（.json）を書く。
+    verify=True なら作ったあと verify_backup() で確認する。確認に失敗したものは
+    failed/ に移して古いバックアップは消さない（壊れたコピーで正常な世代を押し出さないように）。
+    確認が通ったとき（verify=False なら毎回）だけ、keep 件を超えた古いものを消す。
+
+    Returns:
+        dict: manifest の内容
+    """
+    directory = backup_dir_for(db_path)
+    os.makedirs(directory, exist_ok=True)
+    # 同じ秒に2回作っても名前が重ならないようマイクロ秒まで入れる。
+    # それでも重なったら（別プロセスと同時など）上書きせずに失敗させる
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    path = os.path.join(directory, f'{BACKUP_PREFIX}{stamp}.db')
+    partial = path + '.partial'
+    if os.path.exists(path):
+        raise FileExistsError(f'バックアップが既にあります: {path}')
+    os.close(os.open(partial, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+
+    started = time.perf_counter()
+    try:
+        online_copy(db_path, partial, pages=pages, sleep=sleep, progress=progress)
+        # コピーは WAL の設定も引き継ぐので、開いたときに -wal / -shm ができないよう通常のファイルにする
+        conn = sqlite3.connect(partial)
+        conn.execute('PRAGMA journal_mode=DELETE')
+        conn.close()
+    except BaseException:
+        os.remove(partial)
+        raise
+    os.replace(partial, path)
+    seconds = time.perf_counter() - started
+
+    manifest = {
+        'path': path,
+        'source': os.path.abspath(db_path),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'size': os.path.getsize(path),
+        'sha256': _sha256(path),
+        'seconds': round(seconds, 3),
+        'pages_per_step': pages,
+    }
+    if verify:
+        manifest['verify'] = verify_backup(path, manifest['sha256'])
+    with open(_manifest_path(path), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    if verify and not manifest['verify']['ok']:
+        manifest['failed_path'] = _move_aside(path)
+        manifest['removed'] = []
+        return manifest
+    manifest['removed'] = rotate(db_path, keep)
+    return manifest
+
+
+def _move_aside(path):
+    """確認に失敗したバックアップを manifest ごと failed/ に移す。移した先を返す"""
+    failed_dir = os.path.join(os.path.dirname(path), FAILED_DIR)
+    os.makedirs(failed_dir, exist_ok=True)
+    dest = os.path.join(failed_dir, os.path.basename(path))
+    os.replace(_manifest_path(path), _manifest_path(dest))
+    os.replace(path, dest)
+    return dest
+
+
+def verify_backup(path, sha256=None):
+    """
+    バックアップを確認する。
+    チェックサムが manifest と一致し、作業用ファイルに復元して integrity_check が ok なら成功。
+
+    Returns:
+        dict: ok, integrity, checksum_ok, tables（テーブルごとの行数）
+    """
+    if sha256 is None and os.path.exists(_manifest_path(path)):
+        with open(_manifest_path(path), encoding='utf-8') as f:
+            sha256 = json.load(f).get('sha256')
+    checksum_ok = sha256 is None or _sha256(path) == sha256
+
+    scratch_dir = tempfile.mkdtemp(prefix='restore-')
+    try:
+        scratch = os.path.join(scratch_dir, 'restore.db')
+        online_copy(path, scratch, pages=-1, sleep=0)
+        conn = sqlite3.connect(scratch)
+        try:
+            integrity = conn.execute('PRAGMA integrity_check').fetchone()[0]
+            tables = {
+                name: conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+                for (name,) in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
+            }
+        finally:
+            conn.close()
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    return {
+        'ok': checksum_ok and integrity == 'ok',
+        'checksum_ok': checksum_ok,
+        'integrity': integrity,
+        'tables': tables,
+    }
+
+
+def list_backups(db_path):
+    """バックアップの manifest を新しい順に返す"""
+    directory = backup_dir_for(db_path)
+    if not os.path.isdir(directory):
+        return []
+    manifests = []
+    for filename in sorted(os.listdir(directory), reverse=True):
+        if not (filename.startswith(BACKUP_PREFIX) and filename.endswith('.db')):
+            continue
+        path = os.path.join(directory, filename)
+        manifest = {'path': path, 'size': os.path.getsize(path)}
+        if os.path.exists(_manifest_path(path)):
+            with open(_manifest_path(path), encoding='utf-8') as f:
+                manifest.update(json.load(f))
+        manifests.append(manifest)
+    return manifests
+
+
+def rotate(db_path, keep=DEFAULT_KEEP):
+    """
+    確認が通ったもの（確認していないものを含む）を新しいものから keep 件残して削除する。
+    確認に失敗したものは数えず、消さない。削除したパスを返す
+    """
+    good = [m for m in list_backups(db_path) if m.get('verify', {}).get('ok', True)]
+    removed = []
+    for manifest in good[keep:]:
+        backup_path = manifest['path']
+        for path in (backup_path, f'{backup_path}-wal', f'{backup_path}-shm',
+                     f'{backup_path}-journal', _manifest_path(backup_path)):
+            if os.path.exists(path):
+                os.remove(path)
+        removed.append(manifest['path'])
+    return removed
+
+
+@jobs.job('backup_database')
+def backup_database_job(ctx, keep=DEFAULT_KEEP, pages=DEFAULT_PAGES):
+    import database
+
+    def progress(done, total):
+        ctx.progress(done, total, 'バックアップ中')
+
+    manifest = create_backup(database.db_path(), pages=pages, keep=keep, progress=progress)
+    if not manifest['verify']['ok']:
+        raise RuntimeError(f"バックアップの確認に失敗しました（{manifest['failed_path']} に移しました）: "
+                           f"{manifest['verify']}")
+    return manifest
+
+
+# ---- 計測 ----
+
+def make_synthetic_db(path, rows, journal_mode='wal'):
+    """計測用に daily_reports だけを持つ大きめの DB を作る"""
+    conn = sqlite3.connect(path)
+    conn.execute(f'PRAGMA journal_mode={journal_mode}')
+    conn.execute(
+        'CREATE TABLE daily_reports (id INTEGER PRIMARY KEY, name VARCHAR(100), title VARCHAR(200), '
+        'task VARCHAR(500), date VARCHAR(10), work_minutes INTEGER, total_minutes INTEGER)')
+    batch = 50000
+    for offset in range(0, rows, batch):
+        conn.executemany(
+            'INSERT INTO daily_reports (name, title, task, date, work_minutes, total_minutes) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            ((f'社員{i % 200}', f'案件{i % 97}', '配線工事 / 盤改修 ' * 3,
+              f'20{20 + i % 6}-{1 + i % 12:02d}-{1 + i % 28:02d}', 120, 150)
+             for i in range(offset, min(rows, offset + batch))))
+        conn.commit()
+    conn.close()
+
+
+def _write_latencies(path, stop, latencies):
+    conn = sqlite3.connect(path, timeout=30)
+    while not stop.is_set():
+        started = time.perf_counter()
+        conn.execute("INSERT INTO daily_reports (name, date, work_minutes) VALUES ('bench', '2026-01-01', 60)")
+        conn.commit()
+        latencies.append(time.perf_counter() - started)
+        time.sleep(0.01)
+    conn.close()
+
+
+def _summary(latencies):
+    if not latencies:
+        return {'count': 0}
+    values = sorted(latencies)
+    pick = lambda q: values[min(len(values) - 1, int(len(values) * q))] * 1000
+    return {'count': len(values), 'p50_ms': round(pick(0.5), 2),
+            'p99_ms': round(pick(0.99), 2), 'max_ms': round(values[-1] * 1000, 2)}
+
+
+def benchmark(rows=1_000_000, pages=DEFAULT_PAGES, sleep=DEFAULT_SLEEP, baseline_seconds=2.0,
+              journal_mode='wal'):
+    """
+    大きな合成DBでバックアップ時間と、その間の書き込みレイテンシを計測する。
+    書き込みは 10ms ごとに1件コミットする接続で測る。
+    journal_mode='delete' にすると WAL でない場合と比べられる（pages=-1 の一括コピーになる）。
+    """
+    if journal_mode != 'wal':
+        # WAL でないと書き込みのたびにコピーがやり直しになり終わらないので一括でコピーする
+        pages = -1
+    work = tempfile.mkdtemp(prefix='backup-bench-')
+    try:
+        src = os.path.join(work, 'unified.db')
+        make_synthetic_db(src, rows, journal_mode)
+
+        def measure(during_backup):
+            stop = threading.Event()
+            latencies = []
+            writer = threading.Thread(target=_write_latencies, args=(src, stop, latencies))
+            writer.start()
+            started = time.perf_counter()
+            if during_backup:
+                online_copy(src, os.path.join(work, 'backup.db'), pages=pages, sleep=sleep)
+            else:
+                time.sleep(baseline_seconds)
+            seconds = time.perf_counter() - started
+            stop.set()
+            writer.join()
+            return seconds, _summary(latencies)
+
+        _, baseline = measure(False)
+        backup_seconds, during = measure(True)
+        return {
+            'rows': rows,
+            'journal_mode': journal_mode,
+            'size_mb': round(os.path.getsize(src) / 1024 / 1024, 1),
+            'pages_per_step': pages,
+            'backup_seconds': round(backup_seconds, 2),
+            'write_latency_baseline': baseline,
+            'write_latency_during_backup': during,
+        }
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def main():
+    from database import DB_PATH
+
+    parser = argparse.ArgumentParser(description='unified.db のオンラインバックアップ')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('create', help='バックアップを作成して確認する')
+    p.add_argument('--keep', type=int, default=DEFAULT_KEEP)
+    p.add_argument('--pages', type=int, default=DEFAULT_PAGES)
+    sub.add_parser('list', help='バックアップ一覧')
+    p = sub.add_parser('verify', help='バックアップを確認する')
+    p.add_argument('path')
+    p = sub.add_parser('bench', help='合成DBでバックアップ時間と書き込みへの影響を測る')
+    p.add_argument('--rows', type=int, default=1_000_000)
+    p.add_argument('--pages', type=int, default=DEFAULT_PAGES)
+    p.add_argument('--journal-mode', choices=('wal', 'delete'), default='wal')
+    args = parser.parse_args()
+
+    if args.command == 'create':
+        manifest = create_backup(DB_PATH, pages=args.pages, keep=args.keep)
+        status = '✅' if manifest['verify']['ok'] else '⚠'
+        print(f"{status} {manifest.get('failed_path', manifest['path'])}  {manifest['size']:,} bytes  "
+              f"{manifest['seconds']}s  integrity={manifest['verify']['integrity']}")
+    elif args.command == 'list':
+        for m in list_backups(DB_PATH):
+            ok = m.get('verify', {}).get('ok')
+            print(f"{m.get('created_at', '-'):<20} {m['size']:>12,}  {'ok' if ok else '--'}  {m['path']}")
+    elif args.command == 'verify':
+        print(json.dumps(verify_backup(args.path), ensure_ascii=False, indent=2))
+    elif args.command == 'bench':
+        print(json.dumps(benchmark(args.rows, args.pages, journal_mode=args.journal_mode), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
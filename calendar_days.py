@@ -0,0 +1,258 @@
+import argparse
+from datetime import date as dt_date, datetime, timedelta
+from sqlalchemy import func, insert
+from models import db, CalendarDay, CompanyCalendar, DailyReport
+import jobs
+
+# 日の区分
+WEEKDAY = 'weekday'                    # 平日
+WEEKEND = 'weekend'                    # 土日
+NATIONAL_HOLIDAY = 'national_holiday'  # 祝日（jpholiday）
+COMPANY_HOLIDAY = 'company_holiday'    # 会社休日
+WORKDAY = 'workday'                    # 出勤日（土日・祝日を上書き）
+PAIDLEAVE = 'paidleave'                # 指定有給日
+
+DAY_TYPES = (WEEKDAY, WEEKEND, NATIONAL_HOLIDAY, COMPANY_HOLIDAY, WORKDAY, PAIDLEAVE)
+HOLIDAY_TYPES = (WEEKEND, NATIONAL_HOLIDAY, COMPANY_HOLIDAY)
+
+# calendar_days に持つ期間（今年から前後何年か）
+YEARS_BACK = 5
+YEARS_AHEAD = 2
+
+
+def default_span():
+    year = dt_date.today().year
+    return year - YEARS_BACK, year + YEARS_AHEAD
+
+
+def resolve(date_obj, company_type=None, company_description=None, holiday_name=None):
+    """
+    1日分の区分を決める（休日判定はすべてここを通す）。
+
+    会社カレンダーの holiday / workday / paidleave が最優先で、
+    それ以外は祝日 → 土日 → 平日の順に判定する。
+
+    Returns:
+        (区分, 説明)
+    """
+    ctype = (company_type or '').strip().lower()
+    if ctype == 'holiday':
+        return COMPANY_HOLIDAY, company_description
+    if ctype == 'workday':
+        return WORKDAY, company_description
+    if ctype == 'paidleave':
+        # 業務ロジック: 有給は休日扱いしない
+        return PAIDLEAVE, company_description
+    if holiday_name:
+        return NATIONAL_HOLIDAY, holiday_name
+    if date_obj.weekday() >= 5:
+        return WEEKEND, company_description
+    return WEEKDAY, company_description
+
+
+def _split_company(rows):
+    """(日付, type, 説明) の並びを {'YYYY-MM-DD': (type, 説明)}, {'MM-DD': (type, 説明)} に分ける"""
+    exact, yearless = {}, {}
+    for date_str, ctype, description in rows:
+        date_str = (date_str or '').strip()
+        target = yearless if len(date_str) == 5 else exact
+        target[date_str] = (ctype, description)
+    return exact, yearless
+
+
+def _company_lookup():
+    """会社カレンダーを {'YYYY-MM-DD': (type, 説明)}, {'MM-DD': (type, 説明)} に分ける"""
+    return _split_company((row.date, row.type, row.description) for row in CompanyCalendar.query.all())
+
+
+def build_rows(start_year, end_year, company_rows):
+    """
+    calendar_days に入れる行を作る（DB に触らないので、マイグレーションからも使える）。
+
+    Args:
+        company_rows: 会社カレンダーの (日付, type, 説明) の並び
+    """
+    exact, yearless = _split_company(company_rows)
+    return list(_rows(dt_date(start_year, 1, 1), dt_date(end_year, 12, 31), exact, yearless))
+
+
+def _rows(start, end, exact, yearless):
+    import jpholiday
+
+    holidays = {}
+    for year in range(start.year, end.year + 1):
+        for date_obj, name in jpholiday.year_holidays(year):
+            holidays[date_obj] = name
+
+    day = start
+    while day <= end:
+        date_str = day.isoformat()
+        # 年ありの指定を年なしより優先する
+        company = exact.get(date_str) or yearless.get(date_str[5:]) or (None, None)
+        day_type, description = resolve(day, company[0], company[1], holidays.get(day))
+        yield {
+            'date': date_str,
+            'day_type': day_type,
+            'is_holiday': day_type in HOLIDAY_TYPES,
+            'description': description,
+        }
+        day += timedelta(days=1)
+
+
+def rebuild(start_year=None, end_year=None, commit=True):
+    """指定した年の calendar_days を作り直す。作った日数を返す"""
+    if start_year is None or end_year is None:
+        start_year, end_year = default_span()
+    start, end = dt_date(start_year, 1, 1), dt_date(end_year, 12, 31)
+
+    exact, yearless = _company_lookup()
+    rows = list(_rows(start, end, exact, yearless))
+
+    db.session.query(CalendarDay)\
+        .filter(CalendarDay.date.between(start.isoformat(), end.isoformat()))\
+        .delete(synchronize_session=False)
+    db.session.execute(insert(CalendarDay), rows)
+    if commit:
+        db.session.commit()
+    return len(rows)
+
+
+def ensure_years(*years):
+    """まだ作っていない年があれば作る"""
+    built = False
+    for year in years:
+        exists = db.session.query(CalendarDay.date)\
+            .filter(CalendarDay.date.between(f'{year}-01-01', f'{year}-12-31')).first()
+        if not exists:
+            rebuild(year, year, commit=False)
+            built = True
+    if built:
+        db.session.commit()
+
+
+def refresh(date_str):
+    """
+    会社カレンダーを変更した日付だけを作り直す（コミットは呼び出し側）。
+    年なし（'MM-DD'）の場合は calendar_days にある全ての年の同じ日を作り直す。
+    """
+    db.session.flush()
+    date_str = date_str.strip()
+    if len(date_str) == 5:
+        first, last = db.session.query(func.min(CalendarDay.date), func.max(CalendarDay.date)).one()
+        if not first:
+            return
+        targets = [f'{year}-{date_str}' for year in range(int(first[:4]), int(last[:4]) + 1)]
+    else:
+        targets = [date_str]
+
+    exact, yearless = _company_lookup()
+    for target in targets:
+        try:
+            day = datetime.strptime(target, '%Y-%m-%d').date()
+        except ValueError:
+            continue
+        row = db.session.get(CalendarDay, target)
+        if row is None:
+            # 作っていない期間は day_info() がその場で判定する
+            continue
+        new = next(_rows(day, day, exact, yearless))
+        row.day_type = new['day_type']
+        row.is_holiday = new['is_holiday']
+        row.description = new['description']
+
+
+def day_info(date_str):
+    """
+    1日分の CalendarDay を返す。calendar_days に無い日はその場で判定する（保存はしない）。
+    date_str が不正なら ValueError。
+    """
+    day = datetime.strptime(date_str, '%Y-%m-%d').date()
+    row = db.session.get(CalendarDay, date_str)
+    if row is not None:
+        return row
+
+    import jpholiday
+    record = CompanyCalendar.query.filter(
+        (CompanyCalendar.date == date_str) | (CompanyCalendar.date == date_str[5:])
+    ).order_by(func.length(CompanyCalendar.date).desc()).first()
+    day_type, description = resolve(
+        day,
+        record.type if record else None,
+        record.description if record else None,
+        jpholiday.is_holiday_name(day),
+    )
+    return CalendarDay(date=date_str, day_type=day_type,
+                       is_holiday=day_type in HOLIDAY_TYPES, description=description)
+
+
+def day_types_for(dates):
+    """複数日の CalendarDay を1回のクエリで引く。{日付: CalendarDay}"""
+    dates = set(dates)
+    found = {row.date: row for row in CalendarDay.query.filter(CalendarDay.date.in_(dates))}
+    for date_str in dates - found.keys():
+        try:
+            found[date_str] = day_info(date_str)
+        except ValueError:
+            continue
+    return found
+
+
+def holiday_work_summary(year, day_types=HOLIDAY_TYPES):
+    """
+    年間の休日出勤時間を社員 × 日の区分で集計する（calendar_days と結合した1本のクエリ）。
+
+    Returns:
+        list[dict]: name, day_type, minutes, days
+    """
+    ensure_years(year)
+    rows = db.session.query(
+        DailyReport.name,
+        CalendarDay.day_type,
+        func.sum(DailyReport.holiday_total_minutes),
+        func.count(func.distinct(DailyReport.date)),
+    ).join(CalendarDay, CalendarDay.date == DailyReport.date)\
+        .filter(DailyReport.date.between(f'{year}-01-01', f'{year}-12-31'))\
+        .filter(DailyReport.is_holiday_work.is_(True))\
+        .filter(CalendarDay.day_type.in_(day_types))\
+        .group_by(DailyReport.name, CalendarDay.day_type)\
+        .order_by(DailyReport.name, CalendarDay.day_type)\
+        .all()
+    return [
+        {'name': name, 'day_type': day_type, 'minutes': minutes or 0, 'days': days}
+        for name, day_type, minutes, days in rows
+    ]
+
+
+@jobs.job('rebuild_calendar_days')
+def rebuild_calendar_days_job(ctx, start_year=None, end_year=None):
+    ctx.progress(0, 1, 'calendar_days を作成中', force=True)
+    count = rebuild(start_year, end_year)
+    ctx.progress(1, 1, force=True)
+    return {'days': count}
+
+
+def main():
+    from database import create_app
+
+    parser = argparse.ArgumentParser(description='calendar_days（日の区分）を作成する')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('rebuild', help='指定期間を作り直す（既定: 今年の5年前〜2年後）')
+    p.add_argument('--from', dest='start_year', type=int)
+    p.add_argument('--to', dest='end_year', type=int)
+    p = sub.add_parser('show', help='1日分の区分を表示')
+    p.add_argument('date')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.command == 'rebuild':
+            start_year, end_year = default_span()
+            count = rebuild(args.start_year or start_year, args.end_year or end_year)
+            print(f'✅ {count}日分を作成しました')
+        elif args.command == 'show':
+            info = day_info(args.date)
+            print(f'{info.date} {info.day_type} 休日={info.is_holiday} {info.description or ""}')
+
+
+if __name__ == '__main__':
+    main()
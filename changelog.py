@@ -0,0 +1,172 @@
+import json
+import argparse
+from datetime import datetime, timedelta
+from sqlalchemy import event, insert, func, text, bindparam, Boolean, DateTime
+from sqlalchemy.orm import Session
+from models import db, ChangeLog, DailyReport, CompanyCalendar
+import jobs
+
+# 変更を記録するモデル → change_log.table_name
+TRACKED = {
+    DailyReport: 'daily_reports',
+    CompanyCalendar: 'company_calendar',
+}
+
+# /api/changes が1回に返す件数
+DEFAULT_BATCH_SIZE = 500
+MAX_BATCH_SIZE = 5000
+# これより古い記録は、同じ行の最新の記録だけを残して削除する
+COMPACT_AFTER = timedelta(days=30)
+
+
+def _snapshot(obj):
+    data = {}
+    for column in obj.__table__.columns:
+        value = getattr(obj, column.key)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        data[column.key] = value
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_changes(session, flush_context):
+    """
+    flush した行を change_log に書く。同じ接続・同じトランザクションで書くので、
+    本体がロールバックされれば記録も残らない。
+    """
+    entries = []
+    now = datetime.now()
+    for state, objects in (('insert', session.new), ('update', session.dirty), ('delete', session.deleted)):
+        for obj in objects:
+            if type(obj) not in TRACKED:
+                continue
+            if state == 'update' and not session.is_modified(obj, include_collections=False):
+                continue
+            entries.append(_entry(obj, state, now))
+    if entries:
+        session.connection().execute(insert(ChangeLog), entries)
+
+
+def _entry(obj, op, now):
+    return {
+        'table_name': TRACKED[type(obj)],
+        'row_key': str(obj.id),
+        'op': op,
+        'data': None if op == 'delete' else _snapshot(obj),
+        'changed_at': now,
+    }
+
+
+def record_updates(model, ids):
+    """
+    ORM を通さない一括 UPDATE の後に呼び、更新した行を change_log に書く（コミットは呼び出し側）。
+    """
+    if not ids:
+        return
+    now = datetime.now()
+    rows = model.query.filter(model.id.in_(ids)).populate_existing().all()
+    db.session.execute(insert(ChangeLog), [_entry(obj, 'update', now) for obj in rows])
+
+
+def record_batch(conn, model, ids):
+    """
+    record_updates() の接続版。ORM もセッションも使わず、同じ接続（同じトランザクション）で
+    更新した行を change_log に書く（backfill.py から使う）。
+    data は _snapshot() と同じ形にするが、列は model ではなく DB にある列を使う
+    （マイグレーションの途中でも使えるように）。
+    """
+    if not ids:
+        return
+    table = model.__tablename__
+    types = {column.key: column.type for column in model.__table__.columns}
+    fields = []
+    for (name,) in conn.execute(text('SELECT name FROM pragma_table_info(:table)'), {'table': table}):
+        value = f'"{name}"'
+        if isinstance(types.get(name), Boolean):
+            value = f"CASE WHEN {value} IS NULL THEN NULL WHEN {value} THEN json('true') ELSE json('false') END"
+        elif isinstance(types.get(name), DateTime):
+            value = f"replace({value}, ' ', 'T')"
+        fields.append(f"'{name}', {value}")
+    conn.execute(text(
+        f"INSERT INTO change_log (table_name, row_key, op, data, changed_at) "
+        f"SELECT :table, CAST(id AS TEXT), 'update', json_object({', '.join(fields)}), :now "
+        f"FROM \"{table}\" WHERE id IN (SELECT value FROM json_each(:ids))"
+    ).bindparams(bindparam('now', type_=DateTime())),
+        {'table': TRACKED[model], 'now': datetime.now(), 'ids': json.dumps(list(ids))})
+
+
+def changes_since(since, limit=DEFAULT_BATCH_SIZE, tables=None):
+    """
+    since より後の変更を seq 順に返す。
+
+    Returns:
+        dict: 列ごとの配列（seq / table / key / op / data）と、次に渡す since、続きがあるか
+    """
+    limit = max(1, min(limit, MAX_BATCH_SIZE))
+    query = ChangeLog.query.filter(ChangeLog.seq > since)
+    if tables:
+        query = query.filter(ChangeLog.table_name.in_(tables))
+    rows = query.order_by(ChangeLog.seq).limit(limit + 1).all()
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'seq': [r.seq for r in rows],
+        'table': [r.table_name for r in rows],
+        'key': [r.row_key for r in rows],
+        'op': [r.op for r in rows],
+        'data': [json.loads(r.data) if r.data else None for r in rows],
+        'next': rows[-1].seq if rows else since,
+        'more': more,
+    }
+
+
+def latest_seq():
+    return db.session.query(func.max(ChangeLog.seq)).scalar() or 0
+
+
+def compact(older_than=COMPACT_AFTER):
+    """
+    古い記録のうち、同じ行にもっと新しい記録があるものを削除する。
+    各行の最新の記録（削除の記録を含む）は残すので、どの since から読んでも最終状態は揃う。
+    """
+    cutoff = datetime.now() - older_than
+    latest = db.session.query(func.max(ChangeLog.seq))\
+        .group_by(ChangeLog.table_name, ChangeLog.row_key)
+    deleted = ChangeLog.query\
+        .filter(ChangeLog.changed_at < cutoff)\
+        .filter(ChangeLog.seq.notin_(latest))\
+        .delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+@jobs.job('compact_change_log')
+def compact_change_log_job(ctx, days=COMPACT_AFTER.days):
+    ctx.progress(0, 1, 'change_log を整理中', force=True)
+    deleted = compact(timedelta(days=int(days)))
+    ctx.progress(1, 1, force=True)
+    return {'deleted': deleted}
+
+
+def main():
+    from database import create_app
+
+    parser = argparse.ArgumentParser(description='change_log（変更履歴）の操作')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('compact', help='古い記録を各行の最新だけに整理する')
+    p.add_argument('--days', type=int, default=COMPACT_AFTER.days)
+    sub.add_parser('status', help='件数と最新の seq を表示')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.command == 'compact':
+            print(f'{compact(timedelta(days=args.days))}件を削除しました')
+        elif args.command == 'status':
+            print(f'{ChangeLog.query.count()}件  最新 seq={latest_seq()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import os
+from datetime import timedelta
+from models import db
+
+# 安定するpath
+# このファイルがあるディレクトリ
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
+# 親ディレクトリの絶対パス
+PARENT_DIR = os.path.abspath(os.path.join(BASE_DIR, '..'))
+
+# 上の階層の db ディレクトリを使う
+DB_DIR = os.path.join(PARENT_DIR, 'db')
+
+# 共通DBファイルのパス
+DB_PATH = os.path.join(DB_DIR, 'unified.db')
+
+
+def db_path(app=None):
+    """
+    ORM が実際に使っている DB ファイルのパス。
+    SQLALCHEMY_DATABASE_URI で別の DB を指したときもそちらを返すので、
+    sqlite3 で直接開く処理はすべてここからパスを取る（DB_PATH は既定値にすぎない）。
+    app を渡すとアプリコンテキストの外からでも使える。
+    """
+    if app is None:
+        return db.engine.url.database
+    with app.app_context():
+        return db.engine.url.database
+
+
+def _ensure_db_dir(*args):
+    # import 時ではなく、最初に接続するときにディレクトリを作る
+    path = db_path()
+    if path and path != ':memory:':
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+
+def _enable_wal(dbapi_connection, connection_record):
+    # WAL にしておくと、読み取り（オンラインバックアップを含む）中も書き込みが止まらない
+    # journal_mode は DB ファイルに保存されるので、2回目以降は何もしない
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.close()
+
+
+def init_app(app):
+    """Flask アプリに DB の設定を入れる（Web 画面でも CLI でも共通）"""
+    from sqlalchemy import event
+
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', f'sqlite:///{DB_PATH}')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.secret_key = 'super_secret_key'
+    app.permanent_session_lifetime = timedelta(minutes=5) # セッションの有効期限を10分に設定
+    db.init_app(app)
+
+    # 変更履歴（change_log）の記録を有効にする
+    import changelog  # noqa: F401
+    # 案件別集計（project_monthly）の差分更新を有効にする
+    import projects  # noqa: F401
+
+    with app.app_context():
+        event.listen(db.engine, 'do_connect', _ensure_db_dir)
+        event.listen(db.engine, 'connect', _enable_wal)
+
+    # マイグレーションは flask コマンドから使うときだけ読み込む（alembic の import が重いため）
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+
+def create_app():
+    """
+    画面（ルート）を持たない、DB を使うためだけのアプリ。
+    CLI やワーカーはこちらを使うと app.py を読み込まずに済む。
+    """
+    from flask import Flask
+
+    app = Flask(__name__)
+    init_app(app)
+    return app
@@ -1,4 +1,3 @@
-import jpholiday
 import csv
 from datetime import datetime
 
@@ -59,6 +58,8 @@ class HolidayManager:
         
         if date_str in self.company_workdays:
             return False
+
+        import jpholiday
         
         return (
             jpholiday.is_holiday(date_obj) or
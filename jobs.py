@@ -0,0 +1,395 @@
+import json
+import time
+import argparse
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import update, delete, insert, select, func, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Job, JobSchedule
+import archive
+import database
+
+# 同時に実行するジョブ数の上限
+DEFAULT_MAX_WORKERS = 2
+# キューを確認する間隔（秒）
+POLL_INTERVAL = 1.0
+# 終了したジョブの結果を残す期間
+RESULT_RETENTION = timedelta(days=7)
+# 進捗を書き込む最短間隔（秒）
+PROGRESS_INTERVAL = 0.5
+
+FINISHED_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+# ジョブの種類 → 処理関数
+HANDLERS = {}
+
+# @job で処理関数を登録しているモジュール（使うときに読み込む）
+HANDLER_MODULES = ('monthly', 'calendar_days', 'changelog', 'backup', 'audit', 'projects', 'replica')
+
+
+class JobCancelled(Exception):
+    """キャンセル要求を受けてジョブを中断するときに投げる"""
+
+
+def job(kind):
+    """
+    ジョブ処理関数を登録するデコレータ。
+    処理関数は (ctx, **params) を受け取り、JSON にできる結果を返す。
+    """
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def load_handlers():
+    import importlib
+    for module in HANDLER_MODULES:
+        importlib.import_module(module)
+
+
+def _update_job(job_id, **values):
+    # 処理中のセッションとは別の接続で書き込むので、ジョブ本体の途中結果はコミットされない
+    with db.engine.begin() as conn:
+        return conn.execute(update(Job).where(Job.id == job_id).values(**values)).rowcount
+
+
+class JobContext:
+    """処理関数に渡す進捗報告・キャンセル確認用のオブジェクト"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._last_write = 0.0
+
+    def progress(self, done, total=None, message=None, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_write < PROGRESS_INTERVAL:
+            return
+        self._last_write = now
+        values = {'progress_done': done}
+        if total is not None:
+            values['progress_total'] = total
+        if message is not None:
+            values['message'] = message[:200]
+        _update_job(self.job_id, **values)
+
+    def check_cancelled(self):
+        with db.engine.connect() as conn:
+            requested = conn.execute(
+                db.select(Job.cancel_requested).where(Job.id == self.job_id)
+            ).scalar()
+        if requested:
+            raise JobCancelled()
+
+
+def enqueue(kind, **params):
+    """ジョブをキューに積む（アプリコンテキスト内で呼ぶ）"""
+    if kind not in HANDLERS:
+        raise ValueError(f'未登録のジョブです: {kind}')
+    record = Job(kind=kind, params=json.dumps(params, ensure_ascii=False), status='queued')
+    db.session.add(record)
+    db.session.commit()
+    return record
+
+
+def cancel(job_id):
+    """
+    ジョブのキャンセルを要求する。
+    待機中ならその場でキャンセル、実行中なら処理関数が check_cancelled() したときに止まる。
+    """
+    record = db.session.get(Job, job_id)
+    if not record:
+        return None
+    if record.status == 'queued':
+        record.status = 'cancelled'
+        record.finished_at = datetime.now()
+    elif record.status == 'running':
+        record.cancel_requested = True
+    db.session.commit()
+    return record
+
+
+def purge_finished(retention=RESULT_RETENTION):
+    """保持期間を過ぎた終了済みジョブを削除する"""
+    cutoff = datetime.now() - retention
+    with db.engine.begin() as conn:
+        return conn.execute(
+            delete(Job).where(Job.status.in_(FINISHED_STATUSES), Job.finished_at < cutoff)
+        ).rowcount
+
+
+def recover_interrupted():
+    """プロセスが落ちて running のまま残ったジョブを失敗扱いにする"""
+    with db.engine.begin() as conn:
+        return conn.execute(
+            update(Job).where(Job.status == 'running')
+            .values(status='failed', error='interrupted', finished_at=datetime.now())
+        ).rowcount
+
+
+def _claim_schedule(interval, kind, params, now):
+    """
+    予定を1回分取り、取れたらジョブを積む。次に積む時刻を返す。
+    last_enqueued_at が interval より前のときだけ更新できるので、
+    同時に呼んだプロセスのうち1つだけが積む（更新とジョブの登録は同じトランザクション）。
+    """
+    with db.engine.begin() as conn:
+        # 初めての予定は、これまでに積まれた同じ種類のジョブの時刻から数える
+        conn.execute(sqlite_insert(JobSchedule).values(
+            kind=kind,
+            last_enqueued_at=select(func.max(Job.created_at)).where(Job.kind == kind).scalar_subquery(),
+        ).on_conflict_do_nothing())
+        claimed = conn.execute(
+            update(JobSchedule)
+            .where(JobSchedule.kind == kind,
+                   or_(JobSchedule.last_enqueued_at.is_(None),
+                       JobSchedule.last_enqueued_at <= now - interval))
+            .values(last_enqueued_at=now)
+        ).rowcount
+        if claimed:
+            conn.execute(insert(Job).values(kind=kind, status='queued', created_at=now,
+                                            params=json.dumps(params, ensure_ascii=False)))
+            return now + interval
+        last = conn.execute(
+            select(JobSchedule.last_enqueued_at).where(JobSchedule.kind == kind)).scalar()
+    return last + interval
+
+
+def job_to_dict(record):
+    return {
+        'id': record.id,
+        'kind': record.kind,
+        'params': json.loads(record.params) if record.params else {},
+        'status': record.status,
+        'progress_done': record.progress_done or 0,
+        'progress_total': record.progress_total,
+        'message': record.message,
+        'result': json.loads(record.result) if record.result else None,
+        'error': record.error,
+        'cancel_requested': bool(record.cancel_requested),
+        'created_at': record.created_at.isoformat() if record.created_at else None,
+        'started_at': record.started_at.isoformat() if record.started_at else None,
+        'finished_at': record.finished_at.isoformat() if record.finished_at else None,
+    }
+
+
+class JobRunner:
+    """
+    jobs テーブルをキューとして使うスレッドプール。
+    ジョブの取得は status の条件付き UPDATE で行うので、複数プロセスで動かしても二重実行しない。
+    """
+
+    def __init__(self, app, max_workers=DEFAULT_MAX_WORKERS, poll_interval=POLL_INTERVAL):
+        self.app = app
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self._executor = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._active = set()
+        self._schedules = []
+        self._next_due = {}
+
+    def every(self, interval, kind, **params):
+        """
+        interval（timedelta）ごとに kind のジョブを積む（予定は種類ごとに1つ）。
+        積む権利は job_schedules の行の条件付き UPDATE で取るので、
+        再起動しても、複数プロセスで同じ予定を持っても重ならない。
+        """
+        if any(k == kind for _, k, _ in self._schedules):
+            raise ValueError(f'予定が既にあります: {kind}')
+        self._schedules.append((interval, kind, params))
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            load_handlers()
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix='job')
+            self._thread = threading.Thread(target=self._loop, name='job-dispatcher', daemon=True)
+            self._thread.start()
+
+    def stop(self, wait=True):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+    def run_until_empty(self):
+        """キューが空になるまで実行して戻る（CLI 用）"""
+        self.start()
+        while True:
+            with self.app.app_context():
+                queued = Job.query.filter_by(status='queued').count()
+            with self._lock:
+                active = len(self._active)
+            if not queued and not active:
+                break
+            time.sleep(self.poll_interval)
+        self.stop()
+
+    def _loop(self):
+        last_purge = 0.0
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    with self._lock:
+                        free = self.max_workers - len(self._active)
+                    for job_id in self._claim(free):
+                        with self._lock:
+                            self._active.add(job_id)
+                        self._executor.submit(self._run, job_id)
+
+                    self._enqueue_scheduled()
+
+                    if time.monotonic() - last_purge > 3600:
+                        purge_finished()
+                        last_purge = time.monotonic()
+            except Exception:
+                traceback.print_exc()
+            self._stop.wait(self.poll_interval)
+
+    def _enqueue_scheduled(self):
+        """予定の時刻になったものだけ DB を見る（それまでは何もしない）"""
+        now = datetime.now()
+        for interval, kind, params in self._schedules:
+            due = self._next_due.get(kind)
+            if due is not None and now < due:
+                continue
+            self._next_due[kind] = _claim_schedule(interval, kind, params, now)
+
+    def _claim(self, limit):
+        if limit <= 0:
+            return []
+        candidates = db.session.query(Job.id).filter(Job.status == 'queued')\
+            .order_by(Job.id).limit(limit).all()
+        db.session.rollback()
+        claimed = []
+        for (job_id,) in candidates:
+            with db.engine.begin() as conn:
+                count = conn.execute(
+                    update(Job).where(Job.id == job_id, Job.status == 'queued')
+                    .values(status='running', started_at=datetime.now())
+                ).rowcount
+            if count:
+                claimed.append(job_id)
+        return claimed
+
+    def _run(self, job_id):
+        try:
+            with self.app.app_context():
+                record = db.session.get(Job, job_id)
+                kind = record.kind
+                params = json.loads(record.params) if record.params else {}
+                db.session.rollback()
+
+                try:
+                    handler = HANDLERS.get(kind)
+                    if handler is None:
+                        raise ValueError(f'未登録のジョブです: {kind}')
+                    result = handler(JobContext(job_id), **params)
+                except JobCancelled:
+                    db.session.rollback()
+                    _update_job(job_id, status='cancelled', finished_at=datetime.now())
+                except Exception:
+                    db.session.rollback()
+                    _update_job(job_id, status='failed', error=traceback.format_exc(),
+                                finished_at=datetime.now())
+                else:
+                    _update_job(job_id, status='succeeded',
+                                result=json.dumps(result, ensure_ascii=False, default=str),
+                                finished_at=datetime.now())
+                finally:
+                    db.session.remove()
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
+
+
+# ---- 登録済みジョブ ----
+
+@job('archive_fiscal_year')
+def archive_fiscal_year_job(ctx, fiscal_year):
+    ctx.progress(0, 1, f'{fiscal_year}年度をアーカイブ中', force=True)
+    moved = archive.archive_fiscal_year(database.db_path(), int(fiscal_year))
+    ctx.progress(1, 1, force=True)
+    # VACUUM は移動とは別。DB が使用中でできなくても、移動は成功として返す
+    vacuumed = archive.vacuum(database.db_path()) if moved else False
+    return {'fiscal_year': fiscal_year, 'moved': moved, 'vacuumed': vacuumed}
+
+
+def _parse_params(pairs):
+    params = {}
+    for pair in pairs:
+        key, _, value = pair.partition('=')
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return params
+
+
+def main():
+    from database import create_app
+
+    app = create_app()
+    load_handlers()
+
+    parser = argparse.ArgumentParser(description='バックグラウンドジョブの操作')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('enqueue', help='ジョブを登録する（例: enqueue archive_fiscal_year fiscal_year=2023）')
+    p.add_argument('kind', choices=sorted(HANDLERS))
+    p.add_argument('params', nargs='*', help='key=value')
+    p.add_argument('--wait', action='store_true', help='このプロセスで実行して終わるまで待つ')
+
+    sub.add_parser('list', help='最近のジョブを表示')
+    p = sub.add_parser('status', help='ジョブの状態を表示')
+    p.add_argument('job_id', type=int)
+    p = sub.add_parser('cancel', help='ジョブをキャンセル')
+    p.add_argument('job_id', type=int)
+    p = sub.add_parser('worker', help='キューを処理し続ける')
+    p.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS)
+    sub.add_parser('recover', help='running のまま残ったジョブを失敗扱いにする')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.command == 'enqueue':
+            record = enqueue(args.kind, **_parse_params(args.params))
+            print(f'✅ ジョブ {record.id} を登録しました')
+            if args.wait:
+                JobRunner(app).run_until_empty()
+                print(json.dumps(job_to_dict(db.session.get(Job, record.id)), ensure_ascii=False, indent=2))
+        elif args.command == 'list':
+            for record in Job.query.order_by(Job.id.desc()).limit(20):
+                print(f'{record.id:>5}  {record.status:<10} {record.kind:<24} '
+                      f'{record.progress_done or 0}/{record.progress_total or "-"}  {record.message or ""}')
+        elif args.command == 'status':
+            record = db.session.get(Job, args.job_id)
+            print(json.dumps(job_to_dict(record), ensure_ascii=False, indent=2) if record else 'not found')
+        elif args.command == 'cancel':
+            record = cancel(args.job_id)
+            print(record.status if record else 'not found')
+        elif args.command == 'recover':
+            print(f'{recover_interrupted()}件を失敗扱いにしました')
+
+    if args.command == 'worker':
+        runner = JobRunner(app, max_workers=args.workers)
+        runner.start()
+        print(f'ワーカー起動（同時実行 {args.workers}）。Ctrl+C で終了')
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            runner.stop()
+
+
+if __name__ == '__main__':
+    # app 側と同じ HANDLERS を使うため、モジュールとして import し直して実行する
+    import jobs
+    jobs.main()
@@ -1,6 +1,24 @@
+from datetime import datetime
+from flask import g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 
-db = SQLAlchemy()
+
+class RoutingSession(Session):
+    """
+    読み取り専用のリクエスト（replica.py が g.replica_engine を設定したもの）では
+    スナップショットから読む。flush（書き込み）は常に本番DBに行く。
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context():
+            engine = g.get('replica_engine')
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class DailyReport(db.Model):
     __tablename__ = 'daily_reports'
@@ -18,7 +36,7 @@ class DailyReport(db.Model):
     overtime_before = db.Column(db.Integer)    # 前残業（分）
     overtime_after = db.Column(db.Integer)     # 後残業（分）
     total_minutes = db.Column(db.Integer)      # 合計時間（分）
-    date = db.Column(db.String(10))            # 日付（例: "2025-06-16"）
+    date = db.Column(db.String(10), index=True)  # 日付（例: "2025-06-16"）
     paid_leave_minutes = db.Column(db.Integer, default=0)   # 有休（分）
 
     # 休日出勤かどうか
@@ -37,6 +55,19 @@ class DailyReport(db.Model):
     director_checked = db.Column(db.Boolean, default=False)
     president_checked = db.Column(db.Boolean, default=False)
 
+    # 楽観ロック用のバージョン（更新のたびに +1）
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
+
+    # その日の区分（calendar_days と日付で結合）
+    calendar_day = db.relationship(
+        'CalendarDay',
+        primaryjoin='foreign(DailyReport.date) == CalendarDay.date',
+        viewonly=True,
+        uselist=False,
+    )
+
 
 class CompanyCalendar(db.Model):
     __tablename__ = 'company_calendar'
@@ -44,4 +75,115 @@ class CompanyCalendar(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.String(10), nullable=False)  # 日付（例: "2025-06-16"）
     description = db.Column(db.String(200))  # 説明
-    type = db.Column(db.String(50))  # タイプ（例: "holiday", "event"）
\ No newline at end of file
+    type = db.Column(db.String(50))  # タイプ（例: "holiday", "event"）
+
+
+class CalendarDay(db.Model):
+    __tablename__ = 'calendar_days'
+
+    date = db.Column(db.String(10), primary_key=True)        # 日付（例: "2025-06-16"）
+    day_type = db.Column(db.String(20), nullable=False, index=True)  # weekday / weekend / national_holiday / company_holiday / workday / paidleave
+    is_holiday = db.Column(db.Boolean, nullable=False, default=False)  # 休日扱いか
+    description = db.Column(db.String(200))                  # 祝日名・会社カレンダーの説明
+
+    @property
+    def is_forced_paidleave(self):
+        return self.day_type == 'paidleave'
+
+
+class ChangeLog(db.Model):
+    __tablename__ = 'change_log'
+    __table_args__ = (
+        db.Index('ix_change_log_table_row', 'table_name', 'row_key', 'seq'),
+        # 削除した番号を再利用させない（seq は単調増加）
+        {'sqlite_autoincrement': True},
+    )
+
+    seq = db.Column(db.Integer, primary_key=True)             # 通し番号
+    table_name = db.Column(db.String(50), nullable=False)     # 変更したテーブル
+    row_key = db.Column(db.String(50), nullable=False)        # 行のキー（id など）
+    op = db.Column(db.String(10), nullable=False)             # insert / update / delete
+    data = db.Column(db.Text)                                 # 変更後の行（JSON）。delete は空
+    changed_at = db.Column(db.DateTime, default=datetime.now, index=True)
+
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)     # ジョブの種類（例: "archive_fiscal_year"）
+    params = db.Column(db.Text)                         # 引数（JSON）
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued / running / succeeded / failed / cancelled
+    progress_done = db.Column(db.Integer, default=0)    # 進捗（完了数）
+    progress_total = db.Column(db.Integer)              # 進捗（全体数）
+    message = db.Column(db.String(200))                 # 進捗メッセージ
+    result = db.Column(db.Text)                         # 結果（JSON）
+    error = db.Column(db.Text)                          # 失敗時のエラー
+    cancel_requested = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+
+class JobSchedule(db.Model):
+    __tablename__ = 'job_schedules'
+
+    kind = db.Column(db.String(50), primary_key=True)   # JobRunner.every で積むジョブの種類
+    last_enqueued_at = db.Column(db.DateTime)           # 最後に積んだ日時（条件付き UPDATE で取れたプロセスだけが積む）
+
+
+class SubmitReceipt(db.Model):
+    __tablename__ = 'submit_receipts'
+
+    key = db.Column(db.String(64), primary_key=True)          # 端末が付けた冪等キー
+    name = db.Column(db.String(100))                          # 登録した社員
+    date = db.Column(db.String(10))                           # 登録した日付
+    report_count = db.Column(db.Integer, default=0)           # 登録した件数
+    created_at = db.Column(db.DateTime, default=datetime.now, index=True)
+
+
+class BackfillCheckpoint(db.Model):
+    __tablename__ = 'backfill_checkpoints'
+
+    name = db.Column(db.String(100), primary_key=True)        # バックフィル名（マイグレーションごとに一意）
+    table_name = db.Column(db.String(50), nullable=False)     # 対象テーブル
+    last_key = db.Column(db.Integer)                          # 処理済みの最後の id
+    rows_done = db.Column(db.Integer, default=0)              # 更新した行数
+    batches = db.Column(db.Integer, default=0)                # 実行したバッチ数
+    started_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)                      # 最後まで終わった日時
+
+
+class Project(db.Model):
+    __tablename__ = 'projects'
+
+    title = db.Column(db.String(200), primary_key=True)       # 案件名（DailyReport.title と同じ文字列）
+    client = db.Column(db.String(200))                        # 取引先
+    active = db.Column(db.Boolean, nullable=False, default=True)
+
+    rates = db.relationship('ProjectRate', backref='project', cascade='all, delete-orphan',
+                            order_by='ProjectRate.valid_from')
+
+
+class ProjectRate(db.Model):
+    __tablename__ = 'project_rates'
+
+    title = db.Column(db.String(200), db.ForeignKey('projects.title'), primary_key=True)
+    valid_from = db.Column(db.String(7), primary_key=True)    # この月から適用（例: "2025-04"）
+    hourly_rate = db.Column(db.Integer, nullable=False)       # 時間単価（円）
+
+
+class ProjectMonthly(db.Model):
+    __tablename__ = 'project_monthly'
+
+    # 案件 × 月 × 社員の集計（日報の登録・編集・削除のたびに差分で更新する）
+    title = db.Column(db.String(200), primary_key=True)       # 件名（空の件名は ''）
+    month = db.Column(db.String(7), primary_key=True)         # 月（例: "2025-06"）
+    name = db.Column(db.String(100), primary_key=True)        # 社員
+    minutes = db.Column(db.Integer, nullable=False, default=0)
+    report_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_project_monthly_month_name', 'month', 'name'),
+    )
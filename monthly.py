@@ -0,0 +1,260 @@
+import os
+import time
+import zipfile
+import tempfile
+import argparse
+import multiprocessing
+from collections import defaultdict
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import archive
+import jobs
+import projects
+import worktime
+from report_render import init_worker, pdf_available, render_document
+
+# 主要案件として表示する件数（テンプレートの行数）
+MAIN_TASK_ROWS = 10
+
+
+def format_hours(minutes):
+    """分を '2.5 H' 形式にする"""
+    return f'{round(minutes / 60, 2):g} H'
+
+
+def format_days(days):
+    return f'{round(days, 2):g} 日'
+
+
+def empty_context(name, month):
+    return build_context(name, month, [])
+
+
+def build_context(name, month, reports, figures=None, rules=worktime.DEFAULT_RULES,
+                  project_figures=None, previous_amount=0):
+    """
+    1人1か月分の日報から monthly_report.html のコンテキストを作る。
+    時間の区分は worktime で計算する（figures を渡せばそれを使う）。
+    案件別の時間・金額は project_figures（projects.month_figures() の1人分）を使う。
+    渡さなければ日報から時間だけを数える（金額は 0）。
+    """
+    if figures is None:
+        figures = worktime.compute_reports(reports, [name], rules)[name]
+
+    details = defaultdict(lambda: {'tasks': [], 'partners': []})
+    counted = defaultdict(int)
+    for r in reports:
+        title = r.title or projects.NO_TITLE
+        if project_figures is None:
+            counted[title] += projects.report_minutes(r.is_holiday_work, r.holiday_total_minutes,
+                                                      r.total_minutes)
+        item = details[title]
+        if r.task and r.task not in item['tasks']:
+            item['tasks'].append(r.task)
+        if r.partner and r.partner not in item['partners']:
+            item['partners'].append(r.partner)
+    if project_figures is None:
+        project_figures = {title: {'minutes': minutes, 'amount': 0} for title, minutes in counted.items()}
+
+    tasks = sorted(project_figures.items(), key=lambda kv: kv[1]['minutes'], reverse=True)
+    main_tasks = [
+        {
+            'project_name': title or projects.NO_TITLE_LABEL,
+            'description': ' / '.join(details[title]['tasks'][:2] + details[title]['partners'][:2]),
+            'hours': round(item['minutes'] / 60, 2),
+            'amount': item['amount'],
+        }
+        for title, item in tasks[:MAIN_TASK_ROWS]
+    ]
+    other_tasks = [
+        {
+            'category': title or projects.NO_TITLE_LABEL,
+            'description': ' / '.join(details[title]['tasks'][:2]),
+            'hours': round(item['minutes'] / 60, 2),
+            'amount': item['amount'],
+        }
+        for title, item in tasks[MAIN_TASK_ROWS:]
+    ]
+    main_total_amount = sum(t['amount'] for t in main_tasks)
+    other_total_amount = sum(t['amount'] for t in other_tasks)
+
+    return {
+        'name': name,
+        'month': month,
+        'basic_time': format_days(figures['normal_days']),
+        'overtime_a': format_hours(figures['overtime_a']),
+        'overtime_b': format_hours(figures['overtime_b']),
+        'holiday_work': format_hours(figures['holiday_work']),
+        'total_hours': round(figures['total'] / 60, 2),
+        'paid_leave': format_days(figures['paid_leave'] / rules.standard_day_minutes),
+        'time_diff': format_hours(figures['time_diff']),
+        'late_early': format_hours(figures['late_early']),
+        # 目標はまだ登録する場所が無いので 0
+        'target_amount': 0,
+        'actual_amount': main_total_amount + other_total_amount,
+        'performance_rate': 0,
+        'main_tasks': main_tasks,
+        'main_total_hours': round(sum(t['hours'] for t in main_tasks), 2),
+        'main_total_amount': main_total_amount,
+        'other_tasks': other_tasks,
+        'other_total_hours': round(sum(t['hours'] for t in other_tasks), 2),
+        'other_total_amount': other_total_amount,
+        'previous_amount': previous_amount,
+    }
+
+
+def project_figures_for(month, name=None):
+    """
+    月報に載せる案件別集計と前月の金額（アプリコンテキスト内で呼ぶ）。
+
+    Returns:
+        (figures, previous): 社員 → 件名 → 時間・金額、社員 → 前月の金額の合計
+    """
+    figures = projects.month_figures(month, name)
+    previous = {
+        employee: sum(item['amount'] for item in by_title.values())
+        for employee, by_title in projects.month_figures(projects.previous_month(month), name).items()
+    }
+    return figures, previous
+
+
+def build_month_contexts(db_path, month, rules=worktime.DEFAULT_RULES):
+    """
+    その月の日報を1回のクエリで読み、全社員分の時間を worktime でまとめて計算して
+    社員ごとのコンテキストを作る（アプリコンテキスト内で呼ぶ）。
+    案件別の時間・金額は project_monthly から読む。
+
+    Returns:
+        dict: 名前 → コンテキスト（名前順）
+    """
+    reports = archive.query_reports(db_path, month=month)
+    figures = worktime.compute_reports(reports, rules=rules)
+    project_figures, previous = project_figures_for(month)
+
+    grouped = defaultdict(list)
+    for r in reports:
+        grouped[r.name].append(r)
+    return {
+        name: build_context(name, month, grouped[name], figures[name], rules,
+                            project_figures.get(name, {}), previous.get(name, 0))
+        for name in sorted(grouped)
+    }
+
+
+def validate_month(month):
+    """'YYYY-MM' でなければ ValueError（出力ファイル名に使うので必ず確かめる）"""
+    if not isinstance(month, str) or len(month) != 7:
+        raise ValueError(f'月は YYYY-MM で指定してください: {month!r}')
+    datetime.strptime(month, '%Y-%m')
+    return month
+
+
+def export_dir_for(db_path):
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), 'exports')
+
+
+def _pool_context():
+    # 呼び出し元のスレッドや重いモジュールを引き継がないよう、fork ではなく
+    # report_render だけを読み込んだ forkserver（無い環境では spawn）から起動する
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['report_render'])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def render_month(db_path, month, workers=None, want_pdf=True, progress=None,
+                 rules=worktime.DEFAULT_RULES):
+    """
+    全社員の月報を並列で HTML（WeasyPrint があれば PDF も）に出力し、zip にまとめる。
+    アプリコンテキスト内で呼ぶ。
+
+    Returns:
+        dict: zip のパス、件数、書類ごとの所要時間。PDF を求められたのに出力できなかったときは
+              pdf_skipped に理由が入る（zip は HTML だけになる）
+    """
+    validate_month(month)
+    started = time.perf_counter()
+    contexts = build_month_contexts(db_path, month, rules)
+    compute_seconds = time.perf_counter() - started
+
+    out_dir = os.path.join(export_dir_for(db_path), f'monthly_{month}')
+    os.makedirs(out_dir, exist_ok=True)
+
+    documents = []
+    if contexts:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=_pool_context(),
+                                 initializer=init_worker) as pool:
+            futures = [pool.submit(render_document, ctx, out_dir, want_pdf) for ctx in contexts.values()]
+            for i, future in enumerate(futures, start=1):
+                documents.append(future.result())
+                if progress:
+                    progress(i, len(futures))
+
+    # ダウンロード中の zip を書き換えないよう、同じディレクトリの一時ファイルに書いてから置き換える
+    zip_path = os.path.join(export_dir_for(db_path), f'monthly_{month}.zip')
+    fd, partial_path = tempfile.mkstemp(prefix=f'.monthly_{month}.', suffix='.partial',
+                                        dir=os.path.dirname(zip_path))
+    try:
+        with os.fdopen(fd, 'wb') as f, zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for doc in documents:
+                for path in doc['files']:
+                    zf.write(path, os.path.basename(path))
+        os.replace(partial_path, zip_path)
+    except BaseException:
+        os.unlink(partial_path)
+        raise
+
+    return {
+        'month': month,
+        'zip_path': zip_path,
+        'count': len(documents),
+        'compute_seconds': round(compute_seconds, 4),
+        'total_seconds': round(time.perf_counter() - started, 4),
+        'documents': documents,
+        'pdf_skipped': (None if not want_pdf or pdf_available()
+                        else 'WeasyPrint がインストールされていないため、PDF は出力していません（HTML のみ）'),
+    }
+
+
+@jobs.job('render_monthly_reports')
+def render_monthly_reports_job(ctx, month, pdf=True, workers=None):
+    from flask import current_app
+    import database
+
+    def progress(done, total):
+        ctx.check_cancelled()
+        ctx.progress(done, total, f'{month} 月報を出力中')
+
+    return render_month(database.db_path(), month, workers=workers, want_pdf=pdf,
+                        progress=progress, rules=worktime.WorkRules.from_config(current_app.config))
+
+
+def main():
+    from database import create_app, DB_PATH
+
+    app = create_app()
+
+    parser = argparse.ArgumentParser(description='全社員の月報を一括出力する')
+    parser.add_argument('month', help='対象月（例: 2025-07）')
+    parser.add_argument('--workers', type=int, default=None, help='プロセス数（既定: CPU数）')
+    parser.add_argument('--no-pdf', action='store_true', help='HTML だけ出力する')
+    args = parser.parse_args()
+
+    with app.app_context():
+        result = render_month(DB_PATH, args.month, workers=args.workers, want_pdf=not args.no_pdf)
+
+    if result['pdf_skipped']:
+        print(f"⚠️ {result['pdf_skipped']}")
+    for doc in result['documents']:
+        pdf = f"{doc['pdf_seconds']:.3f}s" if doc['pdf_seconds'] is not None else '-'
+        print(f"{doc['name']:<12} html {doc['html_seconds']:.3f}s  pdf {pdf}")
+    print(f"✅ {result['count']}件  集計 {result['compute_seconds']:.2f}s  "
+          f"合計 {result['total_seconds']:.2f}s  → {result['zip_path']}")
+
+
+if __name__ == '__main__':
+    # app 側と同じ jobs.HANDLERS を使うため、モジュールとして import し直して実行する
+    import monthly
+    monthly.main()
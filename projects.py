@@ -0,0 +1,368 @@
+import sqlite3
+import argparse
+from bisect import bisect_right
+from collections import defaultdict
+from sqlalchemy import event, inspect, text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+from models import db, DailyReport, Project, ProjectRate, ProjectMonthly
+import archive
+import database
+import jobs
+
+# 案件（DailyReport.title）ごとの時間単価と、案件 × 月 × 社員の時間の集計（project_monthly）。
+# 集計は日報の登録・編集・削除の flush のたびに差分で更新するので、月報やダッシュボードは
+# 日報を読まずに project_monthly だけを読めばよい。
+# 金額は「時間 × その月に有効な単価」で読むときに計算する（単価を変えても集計を作り直さなくてよい）。
+#
+# ORM を通さずに日報を書き換えたとき（audit の一括修正など）は rebuild() で作り直す。
+
+# 件名が空の日報の集計キー
+NO_TITLE = ''
+NO_TITLE_LABEL = '（件名なし）'
+
+# 差分の計算に使う列
+_ROLLUP_COLUMNS = ('title', 'date', 'name', 'is_holiday_work', 'holiday_total_minutes', 'total_minutes')
+
+_MINUTES_SQL = ('CASE WHEN is_holiday_work THEN COALESCE(holiday_total_minutes, 0) '
+                'ELSE COALESCE(total_minutes, 0) END')
+
+
+def report_minutes(is_holiday_work, holiday_total_minutes, total_minutes):
+    """集計に入れる日報1件の時間（分）。休日出勤は休日の合計、それ以外は合計"""
+    if is_holiday_work:
+        return holiday_total_minutes or 0
+    return total_minutes or 0
+
+
+def _rollup_key(values):
+    """(件名, 月, 社員) と時間。日付か社員が無い日報は集計しない"""
+    if not values['date'] or not values['name']:
+        return None, 0
+    key = (values['title'] or NO_TITLE, values['date'][:7], values['name'])
+    return key, report_minutes(values['is_holiday_work'], values['holiday_total_minutes'],
+                               values['total_minutes'])
+
+
+def _old_values(obj):
+    """flush 前の値（変更されていない列は今の値）"""
+    attrs = inspect(obj).attrs
+    values = {}
+    for column in _ROLLUP_COLUMNS:
+        history = attrs[column].history
+        values[column] = history.deleted[0] if history.deleted else getattr(obj, column)
+    return values
+
+
+def _new_values(obj):
+    return {column: getattr(obj, column) for column in _ROLLUP_COLUMNS}
+
+
+@event.listens_for(Session, 'after_flush')
+def _maintain_rollup(session, flush_context):
+    """
+    flush した日報の差分を project_monthly に足し込む。changelog と同じく
+    同じ接続・同じトランザクションで書くので、本体がロールバックされれば集計も戻る。
+    """
+    deltas = defaultdict(lambda: [0, 0])
+
+    def add(values, sign):
+        key, minutes = _rollup_key(values)
+        if key is not None:
+            deltas[key][0] += sign * minutes
+            deltas[key][1] += sign
+
+    for obj in session.new:
+        if isinstance(obj, DailyReport):
+            add(_new_values(obj), 1)
+    for obj in session.deleted:
+        if isinstance(obj, DailyReport):
+            add(_old_values(obj), -1)
+    for obj in session.dirty:
+        if isinstance(obj, DailyReport) and session.is_modified(obj, include_collections=False):
+            add(_old_values(obj), -1)
+            add(_new_values(obj), 1)
+
+    changes = [
+        {'title': t, 'month': m, 'name': n, 'minutes': minutes, 'report_count': count}
+        for (t, m, n), (minutes, count) in deltas.items() if minutes or count
+    ]
+    if changes:
+        _apply(session.connection(), changes)
+
+
+def _apply(conn, changes):
+    stmt = insert(ProjectMonthly)
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=['title', 'month', 'name'],
+        set_={
+            'minutes': ProjectMonthly.minutes + stmt.excluded.minutes,
+            'report_count': ProjectMonthly.report_count + stmt.excluded.report_count,
+        },
+    ), changes)
+    # 日報が無くなった組み合わせは消す
+    conn.execute(
+        ProjectMonthly.__table__.delete()
+        .where(ProjectMonthly.report_count <= 0)
+        .where(ProjectMonthly.month.in_({c['month'] for c in changes})))
+
+
+def _month_filter(months):
+    if not months:
+        return '', {}
+    names = [f'm{i}' for i in range(len(months))]
+    return (f" AND substr(date, 1, 7) IN ({', '.join(':' + n for n in names)})",
+            dict(zip(names, months)))
+
+
+def rebuild(db_path, months=None, conn=None):
+    """
+    日報（アーカイブ済み年度も含む）から project_monthly を作り直す（コミットは呼び出し側）。
+    months を渡すとその月だけを作り直す。
+    conn を渡すとセッションではなくその接続で行う（ORM を通さないバックフィルから使う）。
+
+    Returns:
+        int: 作り直した行数
+    """
+    months = sorted(set(months or []))
+    condition, params = _month_filter(months)
+    if conn is None:
+        conn = db.session.connection()
+
+    delete = ProjectMonthly.__table__.delete()
+    if months:
+        delete = delete.where(ProjectMonthly.month.in_(months))
+    conn.execute(delete)
+    # 本番テーブルの分は同じトランザクションの中で集計するので、並行する登録と食い違わない
+    conn.execute(text(
+        f"INSERT INTO project_monthly (title, month, name, minutes, report_count) "
+        f"SELECT COALESCE(title, ''), substr(date, 1, 7), name, SUM({_MINUTES_SQL}), COUNT(*) "
+        f"FROM daily_reports WHERE date IS NOT NULL AND name IS NOT NULL{condition} "
+        f"GROUP BY COALESCE(title, ''), substr(date, 1, 7), name"), params)
+
+    # アーカイブは読み取り専用で変わらないので、別の接続で読んで足し込む
+    if months:
+        years = archive.years_in_range(db_path, f'{months[0]}-01', f'{months[-1]}-31')
+    else:
+        years = archive.archived_years(db_path)
+    for year in years:
+        reader = sqlite3.connect(f'file:{archive.archive_path_for(db_path, year)}?mode=ro', uri=True)
+        try:
+            rows = reader.execute(
+                f"SELECT COALESCE(title, ''), substr(date, 1, 7), name, SUM({_MINUTES_SQL}), COUNT(*) "
+                f"FROM daily_reports WHERE date IS NOT NULL AND name IS NOT NULL{condition} "
+                f"GROUP BY COALESCE(title, ''), substr(date, 1, 7), name", params).fetchall()
+        finally:
+            reader.close()
+        if rows:
+            _apply(conn, [
+                {'title': t, 'month': m, 'name': n, 'minutes': minutes, 'report_count': count}
+                for t, m, n, minutes, count in rows
+            ])
+
+    count = db.select(db.func.count()).select_from(ProjectMonthly)
+    if months:
+        count = count.where(ProjectMonthly.month.in_(months))
+    return conn.execute(count).scalar()
+
+
+def months_for_ids(ids):
+    """日報の id の月の一覧（ids はバインド変数の上限を超えない数で渡す）"""
+    return [m for (m,) in db.session.query(db.func.substr(DailyReport.date, 1, 7))
+            .filter(DailyReport.id.in_(ids))
+            .filter(DailyReport.date.isnot(None))
+            .distinct()]
+
+
+def rebuild_for_ids(db_path, ids, batch_size=900):
+    """ORM を通さずに書き換えた日報の月だけを作り直す（コミットは呼び出し側）"""
+    ids = list(ids)
+    months = set()
+    for i in range(0, len(ids), batch_size):
+        months.update(months_for_ids(ids[i:i + batch_size]))
+    return rebuild(db_path, months) if months else 0
+
+
+# ---- 単価 ----
+
+def load_rates(titles=None):
+    """
+    Returns:
+        dict: 件名 → [(適用開始月, 時間単価), ...]（適用開始月の昇順）
+    """
+    query = ProjectRate.query
+    if titles is not None:
+        query = query.filter(ProjectRate.title.in_(list(titles)))
+    rates = defaultdict(list)
+    for r in query.order_by(ProjectRate.title, ProjectRate.valid_from):
+        rates[r.title].append((r.valid_from, r.hourly_rate))
+    return rates
+
+
+def rate_at(history, month):
+    """month に有効な時間単価（単価が無ければ 0）"""
+    i = bisect_right(history, (month, float('inf')))
+    return history[i - 1][1] if i else 0
+
+
+def amount_for(minutes, hourly_rate):
+    return round(minutes * hourly_rate / 60)
+
+
+def set_rate(title, hourly_rate, valid_from, client=None):
+    """
+    案件の時間単価を登録する（同じ適用開始月があれば上書き。コミットは呼び出し側）。
+    案件がまだ無ければ作る。
+    """
+    project = db.session.get(Project, title)
+    if project is None:
+        project = Project(title=title, active=True)
+        db.session.add(project)
+    if client is not None:
+        project.client = client
+    rate = db.session.get(ProjectRate, (title, valid_from))
+    if rate is None:
+        rate = ProjectRate(title=title, valid_from=valid_from)
+        db.session.add(rate)
+    rate.hourly_rate = int(hourly_rate)
+    return project
+
+
+def project_to_dict(project):
+    return {
+        'title': project.title,
+        'client': project.client,
+        'active': project.active,
+        'rates': [{'valid_from': r.valid_from, 'hourly_rate': r.hourly_rate} for r in project.rates],
+    }
+
+
+# ---- 読み出し ----
+
+def month_figures(month, name=None):
+    """
+    1か月分の集計を社員 × 件名で返す。
+
+    Returns:
+        dict: 社員 → 件名 → {'minutes', 'hourly_rate', 'amount'}
+    """
+    query = ProjectMonthly.query.filter(ProjectMonthly.month == month)
+    if name is not None:
+        query = query.filter(ProjectMonthly.name == name)
+    rows = query.all()
+    rates = load_rates({r.title for r in rows})
+
+    result = defaultdict(dict)
+    for r in rows:
+        hourly_rate = rate_at(rates.get(r.title, []), month)
+        result[r.name][r.title] = {
+            'minutes': r.minutes,
+            'hourly_rate': hourly_rate,
+            'amount': amount_for(r.minutes, hourly_rate),
+        }
+    return result
+
+
+def previous_month(month):
+    year, m = int(month[:4]), int(month[5:7])
+    return f'{year - 1}-12' if m == 1 else f'{year}-{m - 1:02d}'
+
+
+def month_range(month_from, month_to):
+    """'YYYY-MM' から 'YYYY-MM' までの月の一覧"""
+    year, month = int(month_from[:4]), int(month_from[5:7])
+    months = []
+    while f'{year}-{month:02d}' <= month_to:
+        months.append(f'{year}-{month:02d}')
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def dashboard(month_from, month_to, title=None):
+    """
+    全社の案件別（title を渡すとその案件の社員別）の時間・金額を月ごとに返す。
+
+    Returns:
+        dict: months, rows（件名または社員）, minutes / amount: [行][月] の2次元配列,
+              total_minutes / total_amount: 行ごとの合計（金額の多い順）
+    """
+    months = month_range(month_from, month_to)
+    if not months:
+        raise ValueError(f'期間が正しくありません: {month_from} 〜 {month_to}')
+
+    group = ProjectMonthly.name if title is not None else ProjectMonthly.title
+    query = db.session.query(group, ProjectMonthly.title, ProjectMonthly.month,
+                             db.func.sum(ProjectMonthly.minutes))\
+        .filter(ProjectMonthly.month.between(months[0], months[-1]))
+    if title is not None:
+        query = query.filter(ProjectMonthly.title == title)
+    rows = query.group_by(group, ProjectMonthly.title, ProjectMonthly.month).all()
+
+    rates = load_rates({r[1] for r in rows})
+    column = {m: i for i, m in enumerate(months)}
+    minutes = defaultdict(lambda: [0] * len(months))
+    amount = defaultdict(lambda: [0] * len(months))
+    for label, row_title, month, total in rows:
+        i = column[month]
+        minutes[label][i] += total
+        amount[label][i] += amount_for(total, rate_at(rates.get(row_title, []), month))
+
+    labels = sorted(minutes, key=lambda k: (-sum(amount[k]), -sum(minutes[k]), k))
+    return {
+        'from': months[0],
+        'to': months[-1],
+        'title': title,
+        'months': months,
+        'rows': labels,
+        'minutes': [minutes[k] for k in labels],
+        'amount': [amount[k] for k in labels],
+        'total_minutes': [sum(minutes[k]) for k in labels],
+        'total_amount': [sum(amount[k]) for k in labels],
+    }
+
+
+@jobs.job('rebuild_project_rollup')
+def rebuild_project_rollup_job(ctx, months=None):
+    ctx.progress(0, 1, '案件別の集計を作り直し中', force=True)
+    rows = rebuild(database.db_path(), months)
+    db.session.commit()
+    ctx.progress(1, 1, force=True)
+    return {'rows': rows}
+
+
+def main():
+    from database import create_app, DB_PATH
+
+    parser = argparse.ArgumentParser(description='案件の単価と案件別集計（project_monthly）')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('rebuild', help='日報（アーカイブを含む）から集計を作り直す')
+    p.add_argument('--month', action='append', help='作り直す月（複数指定可。省略時はすべて）')
+    p = sub.add_parser('set-rate', help='時間単価を登録する')
+    p.add_argument('title')
+    p.add_argument('hourly_rate', type=int)
+    p.add_argument('--from', dest='valid_from', required=True, help='適用開始月（例: 2025-04）')
+    p.add_argument('--client')
+    p = sub.add_parser('show', help='月の案件別の時間・金額を表示')
+    p.add_argument('month')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.command == 'rebuild':
+            rows = rebuild(DB_PATH, args.month)
+            db.session.commit()
+            print(f'✅ {rows}行を作り直しました')
+        elif args.command == 'set-rate':
+            set_rate(args.title, args.hourly_rate, args.valid_from, args.client)
+            db.session.commit()
+            print(f'✅ {args.title}: {args.valid_from} から {args.hourly_rate:,}円/時')
+        elif args.command == 'show':
+            result = dashboard(args.month, args.month)
+            for label, minutes, amount in zip(result['rows'], result['total_minutes'], result['total_amount']):
+                print(f'{label or NO_TITLE_LABEL:<30} {minutes / 60:>8.1f} H {amount:>12,} 円')
+
+
+if __name__ == '__main__':
+    # app 側と同じ jobs.HANDLERS を使うため、モジュールとして import し直して実行する
+    import projects
+    projects.main()
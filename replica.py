@@ -0,0 +1,269 @@
+import os
+import time
+import sqlite3
+import argparse
+import multiprocessing
+import tempfile
+import threading
+import backup
+import jobs
+
+# 読み取りの多い画面を、定期的に作り直すスナップショット（レプリカ）から返す。
+# スナップショットは本番DBをオンラインバックアップでコピーしたもので、
+# 作り直すときは別ファイルに作ってから置き換えるので、読み取り中の接続は古いファイルを読み切れる。
+# 作り直しは refresh_replica ジョブ（JobRunner.every で定期実行）か CLI（cron 用）で行い、
+# Web のプロセスごとには動かさない。REPLICA_ENABLED=True のときだけ使う。
+
+# スナップショットを作り直す間隔（秒）
+DEFAULT_REFRESH_SECONDS = 30
+# これより古いスナップショットは使わず本番DBから読む（秒）
+DEFAULT_MAX_STALENESS = 120
+# レプリカから返すエンドポイント（GET のみ）。
+# 編集できる一覧（view_reports）は version を返して楽観的排他に使うので、古い値を返すと
+# 保存が不要な 409 になる。入れないこと
+DEFAULT_ENDPOINTS = ('report_chart', 'api_calendar', 'api_project_rollup')
+
+
+def replica_path_for(db_path):
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), 'replica', 'unified-replica.db')
+
+
+def refresh_snapshot(db_path, path=None):
+    """本番DBのスナップショットを作り直す。所要時間（秒）を返す"""
+    path = path or replica_path_for(db_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    started = time.perf_counter()
+    partial = f'{path}.{os.getpid()}.partial'
+    backup.online_copy(db_path, partial)
+    # 置き換えた後は書き込まないので WAL ではなく通常のファイルにしておく
+    conn = sqlite3.connect(partial)
+    conn.execute('PRAGMA journal_mode=DELETE')
+    conn.close()
+    os.replace(partial, path)
+    return time.perf_counter() - started
+
+
+def snapshot_age(path):
+    """スナップショットの古さ（秒）。無ければ None"""
+    try:
+        return time.time() - os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _mark_written(session, flush_context):
+    from flask import g, has_request_context
+
+    if has_request_context():
+        g.replica_written = True
+
+
+class Replica:
+    """
+    リクエストごとの読み先の切り替え（スナップショットの作り直しは refresh_replica ジョブ）。
+
+    - DEFAULT_ENDPOINTS の GET だけをスナップショットから読む（RoutingSession 経由）
+    - スナップショットが max_staleness より古ければ本番DBから読む
+    - 書き込みをしたブラウザは、max_staleness の間は本番DBから読む（自分の入力がすぐ見える）
+    """
+
+    def __init__(self, app, db_path, refresh_seconds=DEFAULT_REFRESH_SECONDS,
+                 max_staleness=DEFAULT_MAX_STALENESS, endpoints=DEFAULT_ENDPOINTS):
+        self.app = app
+        self.db_path = db_path
+        self.path = replica_path_for(db_path)
+        self.refresh_seconds = refresh_seconds
+        self.max_staleness = max_staleness
+        self.endpoints = set(endpoints)
+        self._engine = None
+        self._engine_mtime = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, app, db_path):
+        return cls(
+            app, db_path,
+            refresh_seconds=app.config.get('REPLICA_REFRESH_SECONDS', DEFAULT_REFRESH_SECONDS),
+            max_staleness=app.config.get('REPLICA_MAX_STALENESS', DEFAULT_MAX_STALENESS),
+            endpoints=app.config.get('REPLICA_ENDPOINTS', DEFAULT_ENDPOINTS),
+        )
+
+    def init_app(self):
+        from sqlalchemy import event
+        from sqlalchemy.orm import Session
+
+        self.app.before_request(self._route)
+        self.app.after_request(self._after)
+        event.listen(Session, 'after_flush', _mark_written)
+
+    def stop(self):
+        with self._lock:
+            if self._engine is not None:
+                self._engine.dispose()
+                self._engine = None
+
+    # ---- 読み先の切り替え ----
+
+    def engine(self):
+        """スナップショットの読み取り専用エンジン（ファイルが置き換わったら作り直す）"""
+        import sqlalchemy as sa
+
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return None
+        with self._lock:
+            if self._engine is None or self._engine_mtime != mtime:
+                if self._engine is not None:
+                    self._engine.dispose()
+                # immutable: 置き換えるまで内容が変わらないのでロックを取らずに読む
+                self._engine = sa.create_engine(
+                    f'sqlite:///file:{self.path}?mode=ro&immutable=1&uri=true')
+                self._engine_mtime = mtime
+            return self._engine
+
+    def _route(self):
+        from flask import g, request, session
+
+        if request.method != 'GET' or request.endpoint not in self.endpoints:
+            return
+        if session.get('primary_until', 0) > time.time():
+            g.replica_source = 'primary (recent write)'
+            return
+        age = snapshot_age(self.path)
+        if age is None or age > self.max_staleness:
+            g.replica_source = 'primary (stale)'
+            return
+        engine = self.engine()
+        if engine is not None:
+            g.replica_engine = engine
+            g.replica_source = f'replica ({age:.0f}s)'
+
+    def _after(self, response):
+        from flask import g, request, session
+
+        if g.get('replica_written') and response.status_code < 400:
+            session['primary_until'] = time.time() + self.max_staleness
+        source = g.get('replica_source')
+        if source:
+            response.headers['X-Read-Source'] = source
+        return response
+
+    def status(self):
+        return {
+            'path': self.path,
+            'age_seconds': snapshot_age(self.path),
+            'refresh_seconds': self.refresh_seconds,
+            'max_staleness': self.max_staleness,
+            'endpoints': sorted(self.endpoints),
+        }
+
+
+@jobs.job('refresh_replica')
+def refresh_replica_job(ctx):
+    import database
+
+    seconds = refresh_snapshot(database.db_path())
+    return {'seconds': round(seconds, 3)}
+
+
+# ---- 計測 ----
+
+def _bench_writer(path, stop):
+    conn = sqlite3.connect(path, timeout=30)
+    while not stop.is_set():
+        conn.executemany(
+            "INSERT INTO daily_reports (name, title, date, work_minutes, total_minutes) "
+            "VALUES ('bench', '案件', '2026-01-01', 60, 60)", [()] * 20)
+        conn.commit()
+    conn.close()
+
+
+def benchmark(rows=500_000, writers=4, seconds=3.0):
+    """
+    書き込みが集中している間の読み取りレイテンシを、本番DBとスナップショットで比べる。
+    読み取りは /chart と同じ「1日分を名前順」のクエリ。
+    """
+    work = tempfile.mkdtemp(prefix='replica-bench-')
+    src = os.path.join(work, 'unified.db')
+    try:
+        backup.make_synthetic_db(src, rows)
+        conn = sqlite3.connect(src)
+        conn.execute('CREATE INDEX ix_daily_reports_date ON daily_reports (date)')
+        conn.close()
+        snapshot = os.path.join(work, 'replica', 'unified-replica.db')
+        refresh_seconds = refresh_snapshot(src, snapshot)
+
+        def measure(uri):
+            reader = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            latencies = []
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                reader.execute("SELECT * FROM daily_reports WHERE date = '2025-06-06' "
+                               "ORDER BY name LIMIT 500").fetchall()
+                latencies.append(time.perf_counter() - started)
+            reader.close()
+            latencies.sort()
+            return {
+                'count': len(latencies),
+                'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2),
+                'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+                'max_ms': round(latencies[-1] * 1000, 2),
+            }
+
+        primary_uri, replica_uri = f'file:{src}', f'file:{snapshot}?mode=ro&immutable=1'
+        idle = {'primary': measure(primary_uri), 'replica': measure(replica_uri)}
+
+        # 書き込みは Web のワーカーと同じく別プロセスで行う
+        stop = multiprocessing.Event()
+        processes = [multiprocessing.Process(target=_bench_writer, args=(src, stop)) for _ in range(writers)]
+        for p in processes:
+            p.start()
+        try:
+            busy = {'primary': measure(primary_uri), 'replica': measure(replica_uri)}
+        finally:
+            stop.set()
+            for p in processes:
+                p.join()
+
+        return {
+            'rows': rows,
+            'writers': writers,
+            'refresh_seconds': round(refresh_seconds, 3),
+            'read_latency_idle': idle,
+            'read_latency_during_writes': busy,
+        }
+    finally:
+        for root, dirs, files in os.walk(work, topdown=False):
+            for filename in files:
+                os.remove(os.path.join(root, filename))
+            for dirname in dirs:
+                os.rmdir(os.path.join(root, dirname))
+        os.rmdir(work)
+
+
+def main():
+    import json
+    from database import DB_PATH
+
+    parser = argparse.ArgumentParser(description='読み取り用スナップショット（レプリカ）')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('refresh', help='スナップショットを作り直す')
+    sub.add_parser('status', help='スナップショットの古さを表示')
+    p = sub.add_parser('bench', help='書き込み集中時の読み取りレイテンシを比べる')
+    p.add_argument('--rows', type=int, default=500_000)
+    p.add_argument('--writers', type=int, default=4)
+    args = parser.parse_args()
+
+    if args.command == 'refresh':
+        print(f'✅ {refresh_snapshot(DB_PATH):.2f}秒で作り直しました')
+    elif args.command == 'status':
+        age = snapshot_age(replica_path_for(DB_PATH))
+        print('スナップショットがありません' if age is None else f'{age:.0f}秒前に更新')
+    elif args.command == 'bench':
+        print(json.dumps(benchmark(args.rows, args.writers), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+import os
+import re
+import time
+
+# 帳票のレンダリングだけを行うモジュール。
+# 並列出力のワーカープロセスが読み込むので、Flask / SQLAlchemy は import しない。
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+TEMPLATE_DIR = os.path.join(BASE_DIR, 'templates')
+
+_env = None
+
+
+def comma_filter(value):
+    try:
+        return "{:,}".format(int(value))
+    except (ValueError, TypeError):
+        return value
+
+
+def init_worker():
+    # ワーカーでは Flask を使わず、テンプレートだけを読む
+    global _env
+    from jinja2 import Environment, FileSystemLoader, select_autoescape
+    _env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=select_autoescape(['html']))
+    _env.filters['comma'] = comma_filter
+
+
+def _safe_filename(text):
+    return re.sub(r'[\\/:*?"<>|\s]+', '_', text)
+
+
+def pdf_available():
+    """PDF を出力できるか（WeasyPrint が入っているか）"""
+    try:
+        import weasyprint  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def render_document(context, out_dir, want_pdf, template='monthly_report.html'):
+    """
+    1人分の帳票を HTML（WeasyPrint があれば PDF も）に書き出し、所要時間を返す。
+    PDF を求められたのに出力できなかったときは pdf_skipped に理由を入れる。
+    """
+    if _env is None:
+        init_worker()
+
+    started = time.perf_counter()
+    html = _env.get_template(template).render(**context)
+    base = os.path.join(out_dir, f"{context['month']}_{_safe_filename(context['name'])}")
+    with open(base + '.html', 'w', encoding='utf-8') as f:
+        f.write(html)
+    html_seconds = time.perf_counter() - started
+
+    files = [base + '.html']
+    pdf_seconds = None
+    pdf_skipped = None
+    if want_pdf:
+        try:
+            from weasyprint import HTML
+        except ImportError:
+            HTML = None
+            pdf_skipped = 'WeasyPrint がインストールされていません'
+        if HTML is not None:
+            pdf_started = time.perf_counter()
+            HTML(string=html, base_url=TEMPLATE_DIR).write_pdf(base + '.pdf')
+            pdf_seconds = time.perf_counter() - pdf_started
+            files.append(base + '.pdf')
+
+    return {
+        'name': context['name'],
+        'files': files,
+        'html_seconds': round(html_seconds, 4),
+        'pdf_seconds': round(pdf_seconds, 4) if pdf_seconds is not None else None,
+        'pdf_skipped': pdf_skipped,
+    }
@@ -0,0 +1,198 @@
+import time
+import argparse
+import functools
+import threading
+from collections import Counter, defaultdict
+
+# 同じ内容のリクエストが同時に来たとき（朝礼で全員が /chart?date=今日 を開くなど）、
+# 最初の1件だけが計算し、計算中に来た残りはその結果を待って使う（single-flight）。
+# 結果は計算が終わった時点で捨てる（キャッシュはしない）ので、古い結果を返すことはない。
+# まとめるのは同じプロセス内のリクエストだけ。
+
+# 待つ側がこれより長く待たされたら、自分で計算する（秒）
+DEFAULT_TIMEOUT = 10.0
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    キーごとの実行中の計算を1つにまとめる。
+
+    - do(key, fn): 同じ key の計算が実行中ならその結果を待ち、無ければ自分で fn() を実行する
+    - coalesce: Flask のビュー（GET）に付けるデコレータ。キーは
+      エンドポイント・URL の引数・クエリ文字列・読み先（本番DB / スナップショット）・データのバージョン
+    - 先に計算している側が timeout 秒以内に終わらないか、失敗したときは、待っていた側が自分で計算する
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, version=None, enabled=True):
+        self.timeout = timeout
+        self.version = version
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = defaultdict(Counter)
+
+    @classmethod
+    def from_config(cls, app, version=None):
+        return cls(
+            timeout=app.config.get('SINGLE_FLIGHT_TIMEOUT', DEFAULT_TIMEOUT),
+            version=version,
+            enabled=app.config.get('SINGLE_FLIGHT_ENABLED', True),
+        )
+
+    def do(self, key, fn, label=None):
+        """
+        Returns:
+            (result, shared): shared は他の計算の結果を使ったとき True
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+            stats = self._stats[label]
+
+        if leader:
+            try:
+                call.result = fn()
+                return call.result, False
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                    stats['computed'] += 1
+                    stats['max_waiters'] = max(stats['max_waiters'], call.waiters)
+                call.done.set()
+
+        if not call.done.wait(self.timeout):
+            outcome = 'timeout_fallback'
+        elif call.error is not None:
+            outcome = 'error_fallback'
+        else:
+            outcome = 'coalesced'
+        with self._lock:
+            stats[outcome] += 1
+        if outcome == 'coalesced':
+            return call.result, True
+        return fn(), False
+
+    def coalesce(self, view):
+        """GET のビューに付けると、同じ内容の同時リクエストを1回の計算にまとめる"""
+        from flask import current_app, g, request
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self.enabled or request.method != 'GET':
+                return view(*args, **kwargs)
+
+            key = (
+                request.endpoint,
+                tuple(sorted(kwargs.items())),
+                tuple(sorted(request.args.items(multi=True))),
+                'replica' if g.get('replica_engine') is not None else 'primary',
+                self.version() if self.version else None,
+            )
+
+            def compute():
+                # 他のリクエストでも使えるよう、Response ではなく中身を返す
+                response = current_app.make_response(view(*args, **kwargs))
+                return response.status_code, list(response.headers.items()), response.get_data()
+
+            (status, headers, body), shared = self.do(key, compute, request.endpoint)
+            response = current_app.response_class(body, status=status, headers=headers)
+            if shared:
+                response.headers['X-Single-Flight'] = 'coalesced'
+            return response
+
+        return wrapper
+
+    def status(self):
+        with self._lock:
+            stats = {label: dict(counter) for label, counter in self._stats.items()}
+            in_flight = len(self._calls)
+        return {
+            'enabled': self.enabled,
+            'timeout': self.timeout,
+            'in_flight': in_flight,
+            'endpoints': stats,
+        }
+
+
+# ---- 計測 ----
+
+def benchmark(requests=50, work_seconds=0.05):
+    """
+    requests 件の同じリクエストが同時に来たときの、計算回数と全件が返るまでの時間を
+    single-flight あり・なしで比べる。計算は work_seconds 秒の CPU 処理。
+    """
+    # 1スレッドで work_seconds 秒かかる回数を先に数えておき、計算はその回数だけ回す
+    deadline = time.perf_counter() + work_seconds
+    loops = 0
+    while time.perf_counter() < deadline:
+        loops += 1
+
+    def work():
+        n = 0
+        for _ in range(loops):
+            n += time.perf_counter() > 0
+        return n
+
+    def burst(call):
+        start = threading.Barrier(requests)
+
+        def client():
+            start.wait()
+            call()
+
+        threads = [threading.Thread(target=client) for _ in range(requests)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return round(time.perf_counter() - started, 3)
+
+    computed = Counter()
+
+    def counted():
+        computed['n'] += 1
+        return work()
+
+    plain_seconds = burst(counted)
+    plain_computed = computed['n']
+
+    flight = SingleFlight()
+    computed.clear()
+    coalesced_seconds = burst(lambda: flight.do('chart', counted, 'chart'))
+    return {
+        'requests': requests,
+        'work_seconds': work_seconds,
+        'without': {'computed': plain_computed, 'seconds': plain_seconds},
+        'with': {'computed': computed['n'], 'seconds': coalesced_seconds,
+                 'stats': flight.status()['endpoints']['chart']},
+    }
+
+
+def main():
+    import json
+
+    parser = argparse.ArgumentParser(description='single-flight の効果を測る')
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--work', type=float, default=0.05, help='1回の計算にかかる秒数')
+    args = parser.parse_args()
+    print(json.dumps(benchmark(args.requests, args.work), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
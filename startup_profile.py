@@ -0,0 +1,103 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
+# 起動時間を測るモジュール（Web画面・CLI・ワーカーの入口）
+DEFAULT_MODULES = ('app', 'database', 'models', 'jobs', 'monthly', 'report_render')
+
+# 最初のリクエストまでを測るスクリプト（別プロセスで実行する）。
+# 本番の DB やジョブに触らないよう、一時 DB を使いジョブは起動しない（環境変数で渡す）。
+# テーブル作成は計測に含めない
+FIRST_REQUEST_SCRIPT = '''
+import json, sys, time
+started = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+from models import db
+with app.app_context():
+    db.create_all()
+ready = time.perf_counter()
+client = app.test_client()
+response = client.get(sys.argv[1])
+finished = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - started,
+    "first_request_seconds": finished - ready,
+    "status": response.status_code,
+}))
+'''
+
+
+def import_breakdown(module):
+    """
+    python -X importtime で module を import し、パッケージごとの時間を集計する。
+
+    Returns:
+        (合計秒, [(パッケージ, 自身の秒), ...] 降順)
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=BASE_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    by_package = defaultdict(int)
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_part, cumulative_part, name = line.split(':', 1)[1].split('|')
+        self_us, cumulative_us = int(self_part), int(cumulative_part)
+        package = name.strip().split('.')[0]
+        by_package[package] += self_us
+        # 字下げのない行が最上位の import
+        if name.startswith(' ') and not name.startswith('  '):
+            total += cumulative_us
+
+    ranked = sorted(by_package.items(), key=lambda kv: kv[1], reverse=True)
+    return total / 1e6, [(p, us / 1e6) for p, us in ranked]
+
+
+def first_request(path):
+    """新しいプロセスで app を import し、最初のリクエストが返るまでの時間を測る（一時 DB を使う）"""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ,
+                   FLASK_SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(tmp, 'profile.db')}",
+                   FLASK_JOBS_ENABLED='false')
+        result = subprocess.run(
+            [sys.executable, '-c', FIRST_REQUEST_SCRIPT, path],
+            cwd=BASE_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='起動時間（import の内訳と最初のリクエストまで）を表示する')
+    parser.add_argument('modules', nargs='*', default=list(DEFAULT_MODULES), help='測るモジュール')
+    parser.add_argument('--top', type=int, default=8, help='内訳を表示するパッケージ数')
+    parser.add_argument('--path', default='/', help='最初のリクエストに使う URL')
+    parser.add_argument('--no-request', action='store_true', help='最初のリクエストは測らない')
+    args = parser.parse_args()
+
+    for module in args.modules:
+        total, ranked = import_breakdown(module)
+        print(f'■ import {module}: {total * 1000:.0f} ms')
+        for package, seconds in ranked[:args.top]:
+            print(f'    {package:<24} {seconds * 1000:7.1f} ms')
+
+    if not args.no_request:
+        timing = first_request(args.path)
+        print(f"■ 最初のリクエスト GET {args.path} ({timing['status']}): "
+              f"import {timing['import_seconds'] * 1000:.0f} ms + "
+              f"リクエスト {timing['first_request_seconds'] * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+import os
+import gzip
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+from datetime import date as dt_date, timedelta
+import archive
+
+# 日報の時間帯（タイムライン表示用）を、列ごとの配列にまとめて返す。
+# 社員名と件名は辞書（names / titles）にして、各行はその添字だけを持つ。
+# 描画は templates/timeline.html が canvas で行う。
+
+# 1回に取得できる日数
+MAX_DAYS = 93
+
+# type の値（添字）
+TYPES = ('normal', 'holiday')
+# day_types の値（添字）: 平日 / 休日（会社休日・土日祝）/ 指定有給日
+DAY_TYPES = ('', 'holiday', 'paidleave')
+
+_SPAN_SQL = '''
+    SELECT name, date, title, is_holiday_work AS holiday,
+           CASE WHEN is_holiday_work THEN holiday_start_hour * 60 + holiday_start_minute
+                ELSE start_hour * 60 + start_minute END AS start,
+           CASE WHEN is_holiday_work THEN holiday_end_hour * 60 + holiday_end_minute
+                ELSE end_hour * 60 + end_minute END AS "end",
+           COALESCE(overtime_before, 0) AS before, COALESCE(overtime_after, 0) AS after,
+           CASE WHEN is_holiday_work THEN COALESCE(holiday_total_minutes, 0)
+                ELSE COALESCE(total_minutes, 0) END AS minutes
+    FROM {source} {where}
+'''
+
+
+def _day_range(date_from, date_to):
+    start, end = dt_date.fromisoformat(date_from), dt_date.fromisoformat(date_to)
+    days = (end - start).days + 1
+    if days < 1:
+        raise ValueError(f'期間が正しくありません: {date_from} 〜 {date_to}')
+    if days > MAX_DAYS:
+        raise ValueError(f'期間は{MAX_DAYS}日以内にしてください')
+    return start, days
+
+
+def load_spans(db_path, date_from, date_to, name=None):
+    """
+    期間内の日報の時間帯を、日付・社員・開始時刻の順に読む（アーカイブ済み年度も含む）。
+    開始・終了時刻の無い日報（有休だけの日など）は含めない。
+    """
+    years = archive.years_in_range(db_path, date_from, date_to)
+    conn = archive.open_reader(db_path, years)
+    try:
+        source = archive.union_source(conn, years, [
+            'name', 'date', 'title', 'is_holiday_work',
+            'start_hour', 'start_minute', 'end_hour', 'end_minute',
+            'holiday_start_hour', 'holiday_start_minute', 'holiday_end_hour', 'holiday_end_minute',
+            'overtime_before', 'overtime_after', 'total_minutes', 'holiday_total_minutes',
+        ])
+        where, params = 'WHERE date BETWEEN ? AND ?', [date_from, date_to]
+        if name:
+            where += ' AND name = ?'
+            params.append(name)
+        return conn.execute(
+            f'SELECT * FROM ({_SPAN_SQL.format(source=source, where=where)}) '
+            f'WHERE start IS NOT NULL AND "end" IS NOT NULL '
+            f'ORDER BY date, name, start', params).fetchall()
+    finally:
+        conn.close()
+
+
+def build(rows, date_from, date_to, day_types=None):
+    """
+    load_spans() の行を列ごとの配列にする。
+
+    Args:
+        day_types: {日付: CalendarDay}（calendar_days.day_types_for の戻り値）
+
+    Returns:
+        dict: names / titles（辞書）、days（日数）と day_types（日ごとの DAY_TYPES の添字）、
+              行ごとの name / title / day（from からの日数）/ type / start / end（0時からの分）/
+              before / after（前・後残業の分）/ minutes（その日報の時間）
+    """
+    start, days = _day_range(date_from, date_to)
+    names, titles, offsets = {}, {}, {}
+    columns = {key: [] for key in ('name', 'title', 'day', 'type', 'start', 'end',
+                                   'before', 'after', 'minutes')}
+    for row in rows:
+        day = offsets.get(row['date'])
+        if day is None:
+            day = offsets[row['date']] = (dt_date.fromisoformat(row['date']) - start).days
+        columns['name'].append(names.setdefault(row['name'], len(names)))
+        columns['title'].append(titles.setdefault(row['title'] or '', len(titles)))
+        columns['day'].append(day)
+        columns['type'].append(1 if row['holiday'] else 0)
+        for key in ('start', 'end', 'before', 'after', 'minutes'):
+            columns[key].append(row[key])
+
+    kinds = []
+    for i in range(days):
+        info = (day_types or {}).get((start + timedelta(days=i)).isoformat())
+        if info is not None and info.is_forced_paidleave:
+            kinds.append(2)
+        elif info is not None and info.is_holiday:
+            kinds.append(1)
+        else:
+            kinds.append(0)
+
+    return dict({
+        'from': date_from,
+        'to': date_to,
+        'days': days,
+        'types': TYPES,
+        'day_type_labels': DAY_TYPES,
+        'day_types': kinds,
+        'names': list(names),
+        'titles': list(titles),
+    }, **columns)
+
+
+def timeline(db_path, date_from, date_to, name=None):
+    """期間内の時間帯を列ごとの配列で返す（アプリコンテキスト内で呼ぶ）"""
+    import calendar_days
+
+    start, days = _day_range(date_from, date_to)
+    rows = load_spans(db_path, date_from, date_to, name)
+    day_types = calendar_days.day_types_for(
+        (start + timedelta(days=i)).isoformat() for i in range(days))
+    return build(rows, date_from, date_to, day_types)
+
+
+def encode(result, gzip_level=None):
+    """区切りの空白を入れない JSON（gzip_level を渡すと gzip で圧縮したもの）"""
+    body = json.dumps(result, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return gzip.compress(body, gzip_level) if gzip_level is not None else body
+
+
+# ---- 計測 ----
+
+def make_synthetic_db(path, n_employees=200, month='2025-06', reports_per_day=3, seed=0):
+    """計測用に1か月分の日報を持つ DB を作る"""
+    from models import DailyReport
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    columns = DailyReport.__table__.columns.keys()
+    conn.execute(f'CREATE TABLE daily_reports ({", ".join(columns)})')
+    titles = [f'案件{i:03d}' for i in range(60)]
+    rows = []
+    day = dt_date.fromisoformat(f'{month}-01')
+    while day.strftime('%Y-%m') == month:
+        if day.weekday() < 5:
+            for employee in range(n_employees):
+                start = 8 * 60 + 30
+                for _ in range(reports_per_day):
+                    length = rng.choice((60, 90, 120, 150, 180))
+                    rows.append((f'社員{employee:03d}', day.isoformat(), rng.choice(titles),
+                                 start // 60, start % 60, (start + length) // 60, (start + length) % 60,
+                                 length, False))
+                    start += length
+        day += timedelta(days=1)
+    conn.executemany(
+        'INSERT INTO daily_reports (name, date, title, start_hour, start_minute, end_hour, end_minute, '
+        'total_minutes, is_holiday_work) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+
+
+def benchmark(n_employees=200, month='2025-06'):
+    """全社1か月分のタイムラインの取得時間と JSON の大きさを測る"""
+    work = tempfile.mkdtemp(prefix='timeline-bench-')
+    path = os.path.join(work, 'unified.db')
+    try:
+        make_synthetic_db(path, n_employees, month)
+        last = (dt_date.fromisoformat(f'{month}-01') + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+        started = time.perf_counter()
+        rows = load_spans(path, f'{month}-01', last.isoformat())
+        result = build(rows, f'{month}-01', last.isoformat())
+        seconds = time.perf_counter() - started
+        return {
+            'rows': len(rows),
+            'seconds': round(seconds, 3),
+            'json_bytes': len(encode(result)),
+            'gzip_bytes': len(encode(result, 6)),
+        }
+    finally:
+        for filename in os.listdir(work):
+            os.remove(os.path.join(work, filename))
+        os.rmdir(work)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='タイムラインの取得時間・JSON の大きさを測る')
+    parser.add_argument('--employees', type=int, default=200)
+    parser.add_argument('--month', default='2025-06')
+    args = parser.parse_args()
+
+    result = benchmark(args.employees, args.month)
+    print(f"{result['rows']:,}行  {result['seconds'] * 1000:.0f} ms  "
+          f"JSON {result['json_bytes'] / 1024:.0f} KB  gzip {result['gzip_bytes'] / 1024:.0f} KB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+import time
+import random
+import argparse
+
+# 勤怠の区分（残業A/B・休出・時差・遅刻早退）を社員×日でまとめて計算する。
+# 入力は列ごとの配列（1要素 = 日報1行）で、NumPy で一括計算する。
+# numpy は計算するときだけ読み込む（Web 画面の起動を重くしないため）。
+
+
+class WorkRules:
+    """就業ルール（時刻は 0:00 からの分）"""
+
+    def __init__(self, standard_day_minutes=480, work_start=8 * 60 + 30, work_end=17 * 60 + 30,
+                 breaks=((12 * 60, 13 * 60),), overtime_a_limit=120):
+        self.standard_day_minutes = standard_day_minutes  # 1日の所定労働時間
+        self.work_start = work_start                      # 始業（遅刻の判定）
+        self.work_end = work_end                          # 終業（早退の判定）
+        self.breaks = tuple(breaks)                       # 休憩時間帯（開始, 終了）
+        self.overtime_a_limit = overtime_a_limit          # 1日の残業のうち残業Aとする上限。超えた分は残業B
+
+    @classmethod
+    def from_config(cls, config):
+        """app.config の WORK_RULES（dict）で上書きする"""
+        return cls(**config.get('WORK_RULES', {}))
+
+
+DEFAULT_RULES = WorkRules()
+
+# 社員ごとに返す区分（すべて分。日数は *_days）
+CATEGORIES = (
+    'normal_days', 'holiday_days', 'work', 'overtime_a', 'overtime_b',
+    'holiday_work', 'total', 'paid_leave', 'time_diff', 'late_early',
+)
+
+_MISSING = -1
+
+
+def _minutes(hour, minute):
+    if hour is None or minute is None:
+        return _MISSING
+    return hour * 60 + minute
+
+
+def _value(value):
+    return _MISSING if value is None else value
+
+
+def columns_from_reports(reports, names=None):
+    """
+    DailyReport（または同じ属性を持つ行）のリストを列ごとの配列に変換する。
+
+    Returns:
+        (columns, names, dates): columns は列名 → numpy 配列、
+        employee / day 列は names / dates の添字
+    """
+    import numpy as np
+
+    reports = list(reports)
+    names = list(names) if names is not None else sorted({r.name for r in reports})
+    dates = sorted({r.date for r in reports})
+    name_index = {n: i for i, n in enumerate(names)}
+    date_index = {d: i for i, d in enumerate(dates)}
+
+    rows = [
+        (
+            name_index[r.name],
+            date_index[r.date],
+            bool(r.is_holiday_work),
+            _minutes(r.start_hour, r.start_minute),
+            _minutes(r.end_hour, r.end_minute),
+            _value(r.work_minutes),
+            r.overtime_before or 0,
+            r.overtime_after or 0,
+            r.paid_leave_minutes or 0,
+            r.holiday_total_minutes or 0,
+        )
+        for r in reports if r.name in name_index
+    ]
+    fields = ('employee', 'day', 'holiday', 'start', 'end', 'work',
+              'before', 'after', 'paid', 'holiday_total')
+    if rows:
+        arrays = list(zip(*rows))
+    else:
+        arrays = [()] * len(fields)
+    columns = {
+        field: np.array(values, dtype=bool if field == 'holiday' else np.int64)
+        for field, values in zip(fields, arrays)
+    }
+    return columns, names, dates
+
+
+def derived_work_sql(rules=DEFAULT_RULES, prefix=''):
+    """
+    作業時間が空の行の作業時間（開始〜終了から休憩時間帯との重なりを引いた分。compute() と同じ）を
+    求める SQL 式。時刻が揃っていなければ NULL。prefix はテーブルの別名（例: 'd.'）
+    """
+    start = f'({prefix}start_hour * 60 + {prefix}start_minute)'
+    end = f'({prefix}end_hour * 60 + {prefix}end_minute)'
+    overlap = ' + '.join(
+        f'MAX(0, MIN({end}, {int(break_end)}) - MAX({start}, {int(break_start)}))'
+        for break_start, break_end in rules.breaks
+    ) or '0'
+    return (f'(CASE WHEN {prefix}start_hour IS NOT NULL AND {prefix}start_minute IS NOT NULL '
+            f'AND {prefix}end_hour IS NOT NULL AND {prefix}end_minute IS NOT NULL '
+            f'THEN MAX(0, {end} - {start} - ({overlap})) END)')
+
+
+def _break_overlap(np, start, end, rules):
+    overlap = np.zeros_like(start)
+    for break_start, break_end in rules.breaks:
+        overlap += np.maximum(0, np.minimum(end, break_end) - np.maximum(start, break_start))
+    return overlap
+
+
+def compute(columns, n_employees, rules=DEFAULT_RULES):
+    """
+    列ごとの配列から社員ごとの区分別合計を計算する。
+
+    1日単位（社員×日）に集約してから判定するので、1日に複数の日報があっても
+    残業Aの上限や遅刻・早退はその日全体で判定される。
+    作業時間が空の古い行は、開始〜終了から休憩を引いた時間を作業時間とみなす。
+
+    Returns:
+        dict: 区分名 → 長さ n_employees の int 配列（CATEGORIES 参照）
+    """
+    import numpy as np
+
+    employee = columns['employee']
+    if employee.size == 0:
+        return {c: np.zeros(n_employees, dtype=np.int64) for c in CATEGORIES}
+
+    n_days = int(columns['day'].max()) + 1
+    keys, inverse = np.unique(employee * n_days + columns['day'], return_inverse=True)
+    n = keys.size
+    holiday = columns['holiday']
+    normal = ~holiday
+    start, end = columns['start'], columns['end']
+
+    def per_day(values, mask=None):
+        if mask is not None:
+            values = np.where(mask, values, 0)
+        return np.bincount(inverse, weights=values, minlength=n).astype(np.int64)
+
+    has_times = (start >= 0) & (end >= 0)
+    span = np.where(has_times, end - start - _break_overlap(np, start, end, rules), 0)
+    work = np.where(columns['work'] >= 0, columns['work'], np.maximum(span, 0))
+
+    day_work = per_day(work, normal)
+    day_overtime = per_day(columns['before'] + columns['after'], normal)
+    day_paid = per_day(columns['paid'])
+    day_paid_normal = per_day(columns['paid'], normal)
+    day_holiday = per_day(columns['holiday_total'], holiday)
+    has_normal = per_day(normal.astype(np.int64)) > 0
+    has_holiday = per_day(holiday.astype(np.int64)) > 0
+
+    no_start = np.iinfo(np.int64).max
+    first_start = np.full(n, no_start, dtype=np.int64)
+    valid = normal & (start >= 0)
+    np.minimum.at(first_start, inverse[valid], start[valid])
+    last_end = np.full(n, _MISSING, dtype=np.int64)
+    valid = normal & (end >= 0)
+    np.maximum.at(last_end, inverse[valid], end[valid])
+
+    overtime_a = np.minimum(day_overtime, rules.overtime_a_limit)
+    overtime_b = day_overtime - overtime_a
+
+    attended = day_work + day_paid_normal
+    time_diff = np.where(has_normal, attended - rules.standard_day_minutes, 0)
+    # 遅刻・早退は所定時間に満たない通常日だけ
+    short = has_normal & (attended < rules.standard_day_minutes)
+    late = np.where(short & (first_start != no_start), np.maximum(0, first_start - rules.work_start), 0)
+    early = np.where(short & (last_end >= 0), np.maximum(0, rules.work_end - last_end), 0)
+
+    per_day_values = {
+        'normal_days': has_normal.astype(np.int64),
+        'holiday_days': has_holiday.astype(np.int64),
+        'work': day_work,
+        'overtime_a': overtime_a,
+        'overtime_b': overtime_b,
+        'holiday_work': day_holiday,
+        'total': day_work + day_overtime + day_holiday,
+        'paid_leave': day_paid,
+        'time_diff': time_diff,
+        'late_early': late + early,
+    }
+    day_employee = keys // n_days
+    return {
+        category: np.bincount(day_employee, weights=values, minlength=n_employees).astype(np.int64)
+        for category, values in per_day_values.items()
+    }
+
+
+def compute_reports(reports, names=None, rules=DEFAULT_RULES):
+    """日報のリストから計算し、{名前: {区分: 分}} で返す"""
+    columns, names, _ = columns_from_reports(reports, names)
+    result = compute(columns, len(names), rules)
+    return {
+        name: {category: int(result[category][i]) for category in CATEGORIES}
+        for i, name in enumerate(names)
+    }
+
+
+def compute_python(columns, n_employees, rules=DEFAULT_RULES):
+    """compute() と同じ計算を1行ずつ Python で行う（比較・検証用）"""
+    days = {}
+    for i in range(len(columns['employee'])):
+        key = (int(columns['employee'][i]), int(columns['day'][i]))
+        d = days.setdefault(key, {'work': 0, 'overtime': 0, 'paid': 0, 'paid_normal': 0,
+                                  'holiday': 0, 'normal': False, 'holiday_day': False,
+                                  'first_start': None, 'last_end': None})
+        start, end = int(columns['start'][i]), int(columns['end'][i])
+        paid = int(columns['paid'][i])
+        d['paid'] += paid
+        if columns['holiday'][i]:
+            d['holiday_day'] = True
+            d['holiday'] += int(columns['holiday_total'][i])
+            continue
+
+        d['normal'] = True
+        work = int(columns['work'][i])
+        if work < 0:
+            work = 0
+            if start >= 0 and end >= 0:
+                overlap = sum(max(0, min(end, be) - max(start, bs)) for bs, be in rules.breaks)
+                work = max(0, end - start - overlap)
+        d['work'] += work
+        d['overtime'] += int(columns['before'][i]) + int(columns['after'][i])
+        d['paid_normal'] += paid
+        if start >= 0:
+            d['first_start'] = start if d['first_start'] is None else min(d['first_start'], start)
+        if end >= 0:
+            d['last_end'] = end if d['last_end'] is None else max(d['last_end'], end)
+
+    result = {c: [0] * n_employees for c in CATEGORIES}
+    for (employee, _), d in days.items():
+        overtime_a = min(d['overtime'], rules.overtime_a_limit)
+        attended = d['work'] + d['paid_normal']
+        late_early = 0
+        if d['normal'] and attended < rules.standard_day_minutes:
+            if d['first_start'] is not None:
+                late_early += max(0, d['first_start'] - rules.work_start)
+            if d['last_end'] is not None:
+                late_early += max(0, rules.work_end - d['last_end'])
+
+        values = {
+            'normal_days': int(d['normal']),
+            'holiday_days': int(d['holiday_day']),
+            'work': d['work'],
+            'overtime_a': overtime_a,
+            'overtime_b': d['overtime'] - overtime_a,
+            'holiday_work': d['holiday'],
+            'total': d['work'] + d['overtime'] + d['holiday'],
+            'paid_leave': d['paid'],
+            'time_diff': attended - rules.standard_day_minutes if d['normal'] else 0,
+            'late_early': late_early,
+        }
+        for category, value in values.items():
+            result[category][employee] += value
+    return result
+
+
+def synthetic_columns(n_employees, n_days, reports_per_day=3, seed=0):
+    """ベンチマーク用のダミーデータ（1日あたり数件の日報）"""
+    import numpy as np
+
+    rng = random.Random(seed)
+    rows = []
+    for employee in range(n_employees):
+        for day in range(n_days):
+            holiday = rng.random() < 0.05
+            minute = 8 * 60 + 30 + rng.choice((0, 0, 0, 15, 30))
+            for _ in range(reports_per_day):
+                length = rng.choice((60, 90, 120, 150, 180))
+                start, minute = minute, minute + length
+                rows.append((
+                    employee, day, holiday, start, minute,
+                    -1 if rng.random() < 0.05 else length,
+                    rng.choice((0, 0, 30)), rng.choice((0, 0, 30, 60, 90)),
+                    rng.choice((0,) * 9 + (60,)),
+                    length if holiday else 0,
+                ))
+    fields = ('employee', 'day', 'holiday', 'start', 'end', 'work',
+              'before', 'after', 'paid', 'holiday_total')
+    return {
+        field: np.array(values, dtype=bool if field == 'holiday' else np.int64)
+        for field, values in zip(fields, zip(*rows))
+    }
+
+
+def benchmark(n_employees=200, n_days=22, reports_per_day=3, repeat=3):
+    """NumPy 版と1行ずつの Python 版の所要時間を比べる（結果が一致することも確認する）"""
+    columns = synthetic_columns(n_employees, n_days, reports_per_day)
+
+    def best(func):
+        times = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = func(columns, n_employees)
+            times.append(time.perf_counter() - started)
+        return min(times), result
+
+    numpy_seconds, vectorized = best(compute)
+    python_seconds, looped = best(compute_python)
+    for category in CATEGORIES:
+        if list(vectorized[category]) != looped[category]:
+            raise AssertionError(f'{category} の結果が一致しません')
+
+    return {
+        'rows': int(columns['employee'].size),
+        'numpy_seconds': numpy_seconds,
+        'python_seconds': python_seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='勤怠計算エンジンのベンチマーク')
+    parser.add_argument('--employees', type=int, default=200)
+    parser.add_argument('--days', type=int, default=22)
+    parser.add_argument('--reports-per-day', type=int, default=3)
+    args = parser.parse_args()
+
+    result = benchmark(args.employees, args.days, args.reports_per_day)
+    print(f"{result['rows']:,}行  NumPy {result['numpy_seconds'] * 1000:.1f} ms  "
+          f"Python {result['python_seconds'] * 1000:.1f} ms  "
+          f"（{result['python_seconds'] / result['numpy_seconds']:.1f}倍）")
+
+
+if __name__ == '__main__':
+    main()